@@ -0,0 +1,97 @@
+import os
+from segment_rallies import run_ffmpeg
+from result_cache import file_digest
+from atomic_file import atomic_path
+from rally_timestamps import parse_timestamp, format_timestamp
+
+PROXY_FOLDER = 'proxies'
+
+# Gemini samples uploaded video at about 1 frame per second at low resolution, so these lose
+# little for the model while cutting upload bytes and server-side processing time
+PROXY_PRESETS = {
+    "720p": {"height": 720, "fps": 10},
+    "480p": {"height": 480, "fps": 5},
+    "360p": {"height": 360, "fps": 2},
+    "360p-2x": {"height": 360, "fps": 2, "speed": 2.0},
+}
+
+def _atempo_chain(speed):
+    """ffmpeg's atempo only accepts factors in [0.5, 2], so chain it for larger speed-ups"""
+    filters = []
+    while speed > 2.0:
+        filters.append("atempo=2.0")
+        speed /= 2.0
+    filters.append(f"atempo={speed:.4f}")
+    return ",".join(filters)
+
+def make_proxy(video_path, height=360, fps=2, speed=1.0, output_folder=PROXY_FOLDER, digest=None):
+    """Render a reduced-resolution, reduced-frame-rate analysis copy of a video.
+
+    speed > 1 also compresses time (fewer frames and tokens for the model); timestamps the model
+    reports against the proxy are mapped back with to_source_ms / remap_analysis_timestamps.
+    Returns a dict describing the proxy. Proxies are named after the source's content hash
+    (digest, computed when not given), so an existing proxy is reused only for the same video,
+    never for another match's clip of the same file name.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    digest = digest or file_digest(video_path)
+    proxy_path = os.path.join(output_folder, f"{digest[:16]}-{height}p{fps}fps-{speed:g}x.mp4")
+
+    if not os.path.exists(proxy_path):
+        video_filter = f"scale=-2:{height}"
+        args = ["-i", video_path]
+        if speed != 1.0:
+            video_filter += f",setpts=PTS/{speed}"
+            args += ["-af", _atempo_chain(speed)]
+        # Rendered under a temp name and renamed, so a concurrent job never uploads half a proxy
+        with atomic_path(proxy_path, prefix=".proxy-", suffix=".mp4") as tmp_path:
+            run_ffmpeg(args + [
+                "-vf", f"{video_filter},fps={fps}",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "28",
+                "-c:a", "aac", "-ac", "1", "-b:a", "32k",
+                tmp_path,
+            ])
+
+    return {
+        "path": proxy_path,
+        "source_path": video_path,
+        "height": height,
+        "fps": fps,
+        "speed": speed,
+    }
+
+def to_source_ms(proxy, proxy_ms):
+    """Map a time on the proxy back to the original video"""
+    return int(round(proxy_ms * proxy["speed"]))
+
+def _remap(value, to_source):
+    try:
+        return format_timestamp(to_source(parse_timestamp(value)))
+    except ValueError:
+        # Leave free-form text the model put in a timestamp field untouched
+        return value
+
+def map_analysis_timestamps(results, to_source):
+    """Rewrite every from/to, start/end and Timestamp entry of a result with to_source(ms) -> ms"""
+    def walk(node):
+        if isinstance(node, dict):
+            remapped = {}
+            for key, value in node.items():
+                if key in ("from", "to", "start", "end") and isinstance(value, str):
+                    remapped[key] = _remap(value, to_source)
+                elif key == "Timestamp" and isinstance(value, list):
+                    remapped[key] = [_remap(v, to_source) for v in value]
+                else:
+                    remapped[key] = walk(value)
+            return remapped
+        if isinstance(node, list):
+            return [walk(item) for item in node]
+        return node
+
+    return walk(results)
+
+def remap_analysis_timestamps(results, proxy):
+    """Rewrite every timestamp of a result from proxy time to source time"""
+    if proxy["speed"] == 1.0:
+        return results
+    return map_analysis_timestamps(results, lambda ms: to_source_ms(proxy, ms))
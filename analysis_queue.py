@@ -0,0 +1,279 @@
+"""
+Durable queue of analysis jobs shared by the Streamlit apps and analysis_worker processes.
+
+The apps only enqueue a job and poll its progress, so a browser refresh or widget interaction no
+longer kills a running analysis, and throughput grows with the number of workers. Workers claim
+jobs atomically, report a heartbeat and progress while they run, and store the job's result; a
+job whose worker stopped sending heartbeats is handed to another worker.
+
+Job kinds:
+    match   detect rallies, cut them and analyse every rally (segment_video's pipeline)
+    video   analyse the whole video in one request, or in windows when it is long
+"""
+
+import os
+import json
+import time
+import socket
+from contextlib import closing
+from sqlite_store import SQLiteStore
+
+QUEUE_PATH = os.getenv("ANALYSIS_QUEUE_PATH", "analysis_queue.db")
+KINDS = ("match", "video")
+STATUSES = ("queued", "running", "done", "failed")
+ACTIVE_STATUSES = ("queued", "running")
+PRIORITY_ORDER = {"interactive": 0, "batch": 1}
+STALE_SECONDS = 120         # a running job without a heartbeat for this long is requeued
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    video_digest TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    video_name TEXT,
+    options TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS queue_jobs_claim ON queue_jobs (status, priority, id);
+CREATE INDEX IF NOT EXISTS queue_jobs_video ON queue_jobs (video_digest, kind);
+CREATE TABLE IF NOT EXISTS workers (
+    worker TEXT PRIMARY KEY,
+    job_id INTEGER,
+    seen_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_rallies (
+    job_id INTEGER NOT NULL,
+    rally_index INTEGER NOT NULL,
+    rally TEXT NOT NULL,
+    PRIMARY KEY (job_id, rally_index)
+);
+CREATE TABLE IF NOT EXISTS worker_stats (
+    process TEXT PRIMARY KEY,
+    stats TEXT NOT NULL,
+    reported_at REAL
+);
+"""
+
+def _job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["options"] = json.loads(job["options"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+class AnalysisQueue(SQLiteStore):
+    """SQLite job queue"""
+
+    schema = SCHEMA
+
+    def __init__(self, path=QUEUE_PATH):
+        super().__init__(path)
+
+    def enqueue(self, kind, video_digest, video_path, video_name=None, options=None, priority="interactive"):
+        """Queue a job and return its id; a queued or running job of the same kind for the video with
+        the same options is reused"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown job kind '{kind}', expected one of {KINDS}")
+        # Sorted keys, so equal options always compare equal as stored text
+        options = json.dumps(options or {}, sort_keys=True)
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                f"SELECT id FROM queue_jobs WHERE video_digest = ? AND kind = ? AND options = ? "
+                f"AND status IN {ACTIVE_STATUSES} ORDER BY id DESC LIMIT 1",
+                (video_digest, kind, options),
+            ).fetchone()
+            if row is not None:
+                return row['id']
+            cursor = conn.execute(
+                "INSERT INTO queue_jobs (kind, video_digest, video_path, video_name, options, priority, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+                (kind, video_digest, os.path.abspath(video_path), video_name, options,
+                 PRIORITY_ORDER[priority], time.time()),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """Mark the next queued job (interactive first, then oldest) as running on worker and return it, or
+        None; a job waits while another job of its kind for the same video is running"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs of one kind for one video share its segment folder and journal, so one whose
+                # twin (same video, other options) is running waits for it
+                row = conn.execute(
+                    "SELECT id FROM queue_jobs AS job WHERE status = 'queued' AND NOT EXISTS ("
+                    "SELECT 1 FROM queue_jobs AS twin WHERE twin.status = 'running' "
+                    "AND twin.video_digest = job.video_digest AND twin.kind = job.kind) "
+                    "ORDER BY priority, id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE queue_jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "started_at = ?, heartbeat_at = ?, error = NULL WHERE id = ?",
+                        (worker, now, now, row['id']),
+                    )
+                conn.execute("INSERT OR REPLACE INTO workers VALUES (?, ?, ?)",
+                             (worker, row['id'] if row else None, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row['id']) if row is not None else None
+
+    def progress(self, job_id, progress=None, message=None, stage=None):
+        """Record a heartbeat and, optionally, the job's progress fraction, status message and stage"""
+        now = time.time()
+        updates = {"heartbeat_at": now}
+        for key, value in (("progress", progress), ("message", message), ("stage", stage)):
+            if value is not None:
+                updates[key] = value
+        assignments = ", ".join(f"{key} = ?" for key in updates)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE queue_jobs SET {assignments} WHERE id = ? AND status = 'running'",
+                         list(updates.values()) + [job_id])
+            conn.execute("UPDATE workers SET seen_at = ? WHERE job_id = ?", (now, job_id))
+
+    def add_rally(self, job_id, rally_index, rally):
+        """Store a rally the running job's streamed response has completed, so the apps can show it
+        before the whole analysis is in"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO job_rallies VALUES (?, ?, ?)", (job_id, rally_index, json.dumps(rally)))
+
+    def rallies(self, job_id):
+        """The rallies a running job has streamed so far, in order"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT rally FROM job_rallies WHERE job_id = ? ORDER BY rally_index",
+                                (job_id,)).fetchall()
+        return [json.loads(row['rally']) for row in rows]
+
+    def finish(self, job_id, result):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE queue_jobs SET status = 'done', progress = 1, message = 'Analysis complete!', result = ?, "
+                "finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+            # The result has every rally; the streamed copies are no longer needed
+            conn.execute("DELETE FROM job_rallies WHERE job_id = ?", (job_id,))
+
+    def fail(self, job_id, error):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE queue_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                         (error, time.time(), job_id))
+            conn.execute("DELETE FROM job_rallies WHERE job_id = ?", (job_id,))
+
+    def release_source(self, job_id):
+        """Delete a finished job's source video unless another queued or running job still reads it.
+        The check and the delete hold the write lock, so no job for the file is enqueued in between."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = conn.execute("SELECT video_path FROM queue_jobs WHERE id = ?", (job_id,)).fetchone()
+                in_use = job is not None and conn.execute(
+                    f"SELECT 1 FROM queue_jobs WHERE video_path = ? AND id != ? AND status IN {ACTIVE_STATUSES}",
+                    (job['video_path'], job_id),
+                ).fetchone() is not None
+                if job is not None and not in_use and os.path.exists(job['video_path']):
+                    os.remove(job['video_path'])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def requeue_stale(self, stale_seconds=STALE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """Hand running jobs whose worker went silent back to the queue, or fail them after max_attempts"""
+        cutoff = time.time() - stale_seconds
+        with closing(self._connect()) as conn, conn:
+            failed = conn.execute(
+                "UPDATE queue_jobs SET status = 'failed', error = 'Worker stopped responding', finished_at = ? "
+                "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (time.time(), cutoff, max_attempts),
+            ).rowcount
+            requeued = conn.execute(
+                "UPDATE queue_jobs SET status = 'queued', worker = NULL, message = 'Requeued after a worker stopped' "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (cutoff,),
+            ).rowcount
+        return requeued, failed
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM queue_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row)
+
+    def jobs(self, status=None, limit=50):
+        """Return the most recent jobs, optionally with one status, without their results"""
+        where, params = ("WHERE status = ?", [status]) if status else ("", [])
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT id, kind, video_digest, video_name, status, stage, progress, message, worker, attempts, "
+                f"error, created_at, started_at, finished_at FROM queue_jobs {where} ORDER BY id DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def position(self, job_id):
+        """Number of queued jobs that will be claimed before this one"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS n FROM queue_jobs AS other, queue_jobs AS job WHERE job.id = ? "
+                "AND other.status = 'queued' AND (other.priority < job.priority "
+                "OR (other.priority = job.priority AND other.id < job.id))",
+                (job_id,),
+            ).fetchone()
+        return row['n']
+
+    def workers(self, within=STALE_SECONDS):
+        """Return the workers seen in the last `within` seconds"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM workers WHERE seen_at >= ? ORDER BY worker",
+                                (time.time() - within,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def report_stats(self, process, stats):
+        """Publish a worker process's counters (result cache, connections, scheduler); the apps
+        make no Gemini calls themselves, so their sidebars show these instead of their own"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO worker_stats VALUES (?, ?, ?)",
+                         (process, json.dumps(stats), time.time()))
+
+    def worker_totals(self, within=STALE_SECONDS):
+        """Sum the counters of the worker processes that reported in the last `within` seconds"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT stats FROM worker_stats WHERE reported_at >= ?",
+                                (time.time() - within,)).fetchall()
+        totals = {"processes": len(rows), "cache": {"hits": 0, "misses": 0},
+                  "connections": {"requests": 0, "connections_opened": 0},
+                  "scheduler": {"waiting": 0, "throttled": 0}}
+        for row in rows:
+            stats = json.loads(row['stats'])
+            for group, counters in totals.items():
+                if isinstance(counters, dict):
+                    for key in counters:
+                        counters[key] += stats.get(group, {}).get(key, 0)
+        return totals
+
+def process_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def worker_name(index=0):
+    return f"{process_name()}:{index}"
+
+default_queue = AnalysisQueue()
@@ -0,0 +1,211 @@
+"""
+Worker processes that run the analysis jobs the Streamlit apps put on analysis_queue.
+
+Each process runs --jobs jobs at a time, one per thread, with the same pipeline as batch_runner,
+and writes heartbeats and progress back to the queue until each job is done. The jobs of a
+process share its request_scheduler, so interactive jobs go first and concurrent jobs get fair
+shares of the quota; every process keeps that quota in the queue database, so all of them
+together stay within it and a lone job on an idle deployment can use all of it. Add processes
+(--processes) when cutting rallies, not the Gemini quota, is the bottleneck.
+
+$ python analysis_worker.py --jobs 4
+$ python analysis_worker.py --processes 2 --jobs 2
+$ python analysis_worker.py --once        # drain the queue and exit
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import traceback
+import multiprocessing
+from types import SimpleNamespace
+import gemini_client
+from analysis_queue import default_queue, worker_name, process_name, PRIORITY_ORDER
+from analysis_proxy import PROXY_PRESETS
+from batch_runner import process_video
+from job_journal import default_journal
+from results_store import default_store
+from result_cache import default_cache
+from call_metrics import default_recorder
+from long_video import LONG_VIDEO_SECONDS, video_duration
+from segment_video import run_analysis, run_windowed_analysis
+from request_scheduler import default_scheduler, set_tenant
+
+OUTPUT_FOLDER = os.getenv("ANALYSIS_WORKER_OUTPUT", "worker_results")
+POLL_SECONDS = float(os.getenv("ANALYSIS_WORKER_POLL_SECONDS", 2))
+HEARTBEAT_SECONDS = 10
+PRIORITY_NAMES = {order: name for name, order in PRIORITY_ORDER.items()}
+
+class Heartbeat:
+    """Background thread that keeps a running job's heartbeat fresh; for match jobs it also reports
+    how many rallies the job journal has marked done"""
+
+    def __init__(self, job):
+        self.job = job
+        self.stage = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            self.beat()
+
+    def beat(self):
+        progress = message = None
+        if self.job["kind"] == "match" and self.stage == "analyze":
+            counts = default_journal.status_counts(self.job["video_digest"])
+            total = sum(counts.values())
+            if total:
+                progress = counts.get("done", 0) / total
+                message = f"Analysed {counts.get('done', 0)} of {total} rallies"
+        default_queue.progress(self.job["id"], progress, message, self.stage)
+
+    def set_stage(self, stage, message=None):
+        self.stage = stage
+        default_queue.progress(self.job["id"], message=message, stage=stage)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+def run_match_job(job, heartbeat):
+    options = job["options"]
+    args = SimpleNamespace(
+        output=OUTPUT_FOLDER,
+        cut_mode=options.get("cut_mode", "smart"),
+        cut_workers=1,
+        rally_concurrency=options.get("max_concurrency", 4),
+        proxy=options.get("proxy"),
+        batch_rallies=options.get("batch_rallies", False),
+    )
+    stage_messages = {"detect": "Detecting rallies...", "cut": "Cutting rallies...", "analyze": "Analysing rallies..."}
+    combined_results, failures, timings = process_video(
+        job["video_path"], job["video_digest"], args,
+        on_stage=lambda stage: heartbeat.set_stage(stage, stage_messages[stage]),
+    )
+    combined_results['timings'] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    combined_results['usage'] = default_recorder.summary(match_id=job["video_digest"])
+    combined_results['failed_rallies'] = failures
+    default_store.save_match(job["video_digest"], combined_results, job["video_name"])
+    return combined_results
+
+def run_video_job(job, heartbeat):
+    options = job["options"]
+    proxy = PROXY_PRESETS.get(options.get("proxy"))
+    on_status = lambda message, fraction: default_queue.progress(job["id"], fraction, message)
+    heartbeat.set_stage("analyze")
+    if video_duration(job["video_path"]) > LONG_VIDEO_SECONDS:
+        # Full-length matches are too slow and too large for one request
+        results = run_windowed_analysis(job["video_path"], on_status=on_status, proxy=proxy,
+                                        max_concurrency=options.get("max_concurrency", 4),
+                                        match_id=job["video_digest"], video_digest=job["video_digest"])
+    else:
+        # Rallies are passed on as the response streams in, for the app to show them early
+        results = run_analysis(job["video_path"], on_status=on_status, video_digest=job["video_digest"],
+                               proxy=proxy, match_id=job["video_digest"],
+                               on_rally=lambda idx, rally: default_queue.add_rally(job["id"], idx, rally))
+    if results is None:
+        raise RuntimeError("Video processing failed")
+    return results
+
+JOB_RUNNERS = {"match": run_match_job, "video": run_video_job}
+
+def run_job(job):
+    """Run one claimed job to completion and record its result or error in the queue"""
+    print(f"Job {job['id']}: {job['kind']} analysis of {job['video_name'] or job['video_path']}")
+    set_tenant(f"job:{job['id']}", PRIORITY_NAMES[job["priority"]])
+    try:
+        with Heartbeat(job) as heartbeat:
+            result = JOB_RUNNERS[job["kind"]](job, heartbeat)
+        default_queue.finish(job["id"], result)
+        print(f"Job {job['id']}: done")
+    except Exception as e:
+        traceback.print_exc()
+        default_queue.fail(job["id"], f"{type(e).__name__}: {e}")
+        return
+    # The uploaded copy is kept while the job may be retried or another job still reads it
+    if job["options"].get("delete_source"):
+        default_queue.release_source(job["id"])
+
+def work_loop(index=0, once=False):
+    """Claim and run jobs until interrupted; with once, return when the queue is empty"""
+    name = worker_name(index)
+    print(f"Worker {name} waiting for jobs")
+    while True:
+        requeued, failed = default_queue.requeue_stale()
+        if requeued or failed:
+            print(f"Requeued {requeued} and failed {failed} job(s) of unresponsive workers")
+        job = default_queue.claim(name)
+        if job is not None:
+            run_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(POLL_SECONDS)
+
+def publish_stats(stop):
+    """Report this process's cache, connection and scheduler counters to the queue until stop is set"""
+    while True:
+        scheduler = default_scheduler.stats()
+        default_queue.report_stats(process_name(), {
+            "cache": default_cache.stats(),
+            "connections": gemini_client.connection_stats(),
+            "scheduler": {"waiting": scheduler["waiting"], "throttled": scheduler["throttled"]},
+        })
+        if stop.is_set():
+            return
+        stop.wait(HEARTBEAT_SECONDS)
+
+def run_process(jobs=1, once=False):
+    """Run `jobs` work loops on threads of this process, behind one scheduler whose quota is shared
+    through the queue database with every other worker process"""
+    gemini_client.configure()
+    default_scheduler.share_quota(default_queue.path)
+    stop = threading.Event()
+    publisher = threading.Thread(target=publish_stats, args=(stop,), daemon=True)
+    publisher.start()
+    threads = [threading.Thread(target=work_loop, args=(index, once), daemon=True) for index in range(jobs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One last report, so the counters of a --once run are not lost
+    stop.set()
+    publisher.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=1, help="jobs each process analyses at the same time")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        try:
+            run_process(max(1, args.jobs), args.once)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_process, args=(max(1, args.jobs), args.once))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Jobs cut short here are requeued once their heartbeat goes stale
+        for process in processes:
+            process.terminate()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""
+Write files under a temp name in the same folder and rename them into place, so readers in other
+threads and processes only ever see a missing file or a complete one.
+"""
+
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_path(dest_path, prefix=None, suffix=".tmp"):
+    """Yield a temp path next to dest_path for the block to write; it replaces dest_path when the
+    block succeeds and is removed when it fails"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest_path)), prefix=prefix, suffix=suffix)
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@contextmanager
+def atomic_write(dest_path, mode="w", prefix=None, suffix=".tmp"):
+    """Yield a file opened for writing that replaces dest_path once the block succeeds"""
+    encoding = None if "b" in mode else "utf-8"
+    with atomic_path(dest_path, prefix, suffix) as tmp_path:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+
+def atomic_write_json(dest_path, value, **dump_kwargs):
+    """Replace dest_path with value as JSON"""
+    with atomic_write(dest_path) as f:
+        json.dump(value, f, **dump_kwargs)
@@ -0,0 +1,76 @@
+from google.ai.generativelanguage_v1beta.types import content
+
+# Gemini bills roughly 263 tokens per second of video plus 32 per second of audio
+TOKENS_PER_VIDEO_SECOND = 300
+# Input tokens spent on video per request; well under the model's context window so the
+# system instruction, schema and any retries still fit
+BATCH_INPUT_TOKEN_BUDGET = 120_000
+# The response, not the input, is usually the binding limit: each rally's analysis takes
+# about this many output tokens and the model stops at MAX_OUTPUT_TOKENS
+OUTPUT_TOKENS_PER_CLIP = 1500
+MAX_OUTPUT_TOKENS = 8192
+
+BATCH_MAX_SECONDS = BATCH_INPUT_TOKEN_BUDGET / TOKENS_PER_VIDEO_SECOND
+BATCH_MAX_CLIPS = MAX_OUTPUT_TOKENS // OUTPUT_TOKENS_PER_CLIP
+
+def plan_batches(durations, max_seconds=BATCH_MAX_SECONDS, max_clips=BATCH_MAX_CLIPS):
+    """Group clip indexes, in order, into batches that stay within the duration and clip limits.
+
+    durations are clip lengths in seconds. A clip longer than max_seconds gets a batch of its own.
+    Returns a list of lists of indexes into durations.
+    """
+    batches = []
+    current, current_seconds = [], 0.0
+    for idx, seconds in enumerate(durations):
+        if current and (len(current) >= max_clips or current_seconds + seconds > max_seconds):
+            batches.append(current)
+            current, current_seconds = [], 0.0
+        current.append(idx)
+        current_seconds += seconds
+    if current:
+        batches.append(current)
+    return batches
+
+def make_batch_config(generation_config, id_field="segment_id"):
+    """Wrap a single-clip generation config so the response is {"segments": [{id_field, ...clip result}]}"""
+    clip_schema = generation_config["response_schema"]
+    item_schema = content.Schema(
+        type=content.Type.OBJECT,
+        required=[id_field] + list(clip_schema.required),
+        properties={id_field: content.Schema(type=content.Type.INTEGER), **clip_schema.properties},
+    )
+    return {
+        **generation_config,
+        "max_output_tokens": MAX_OUTPUT_TOKENS,
+        "response_schema": content.Schema(
+            type=content.Type.OBJECT,
+            required=["segments"],
+            properties={
+                "segments": content.Schema(type=content.Type.ARRAY, items=item_schema),
+            },
+        ),
+    }
+
+def batch_parts(files, segment_ids, prompt):
+    """Build the message parts for a batch: each clip preceded by its label, then the prompt"""
+    parts = []
+    for segment_id, file in zip(segment_ids, files):
+        parts += [f"Segment {segment_id}:", file]
+    parts.append(prompt)
+    return parts
+
+def split_batch_result(result, segment_ids, id_field="segment_id"):
+    """Split a batched response back into one single-clip result per segment id.
+
+    Entries the model did not tag are matched by position when the counts agree; segments
+    missing from the response map to None so the caller can retry them individually.
+    """
+    entries = result.get("segments", [])
+    by_id = {}
+    for position, entry in enumerate(entries):
+        segment_id = entry.pop(id_field, None)
+        if segment_id is None and len(entries) == len(segment_ids):
+            segment_id = segment_ids[position]
+        if segment_id in segment_ids and segment_id not in by_id:
+            by_id[segment_id] = entry
+    return {segment_id: by_id.get(segment_id) for segment_id in segment_ids}
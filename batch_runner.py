@@ -0,0 +1,198 @@
+"""
+Headless batch analysis of whole directories of match videos.
+
+Every video goes through rally detection, cutting and Gemini analysis, a few videos at a time.
+Per-video results (with stage timings) are written to the output folder and the results store,
+and a checkpoint file records finished videos by content hash, so an interrupted run started
+again with the same arguments skips everything that already completed.
+
+$ python batch_runner.py /data/tournament --output batch_results --workers 2
+$ python batch_runner.py videos.txt --proxy 360p --batch-rallies
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import gemini_client
+from rally_detector import detect_rallies
+from segment_rallies import CUT_MODES, split_video, load_manifest, match_folder
+from result_cache import file_digest
+from atomic_file import atomic_write_json
+from analysis_proxy import PROXY_PRESETS
+from match_stats import calculate_summary
+from results_store import default_store
+from call_metrics import default_recorder
+from job_journal import default_journal
+from segment_video import analyze_match_rallies
+from request_scheduler import set_tenant, BATCH
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv")
+OUTPUT_FOLDER = "batch_results"
+
+def collect_videos(sources):
+    """Expand directories and manifests (a text file of paths, one per line, or a JSON list) into video paths"""
+    videos = []
+    for source in sources:
+        if os.path.isdir(source):
+            videos += sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if name.lower().endswith(VIDEO_EXTENSIONS)
+            )
+        elif source.lower().endswith(VIDEO_EXTENSIONS):
+            videos.append(source)
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                text = f.read()
+            base = os.path.dirname(os.path.abspath(source))
+            paths = json.loads(text) if source.lower().endswith(".json") else [
+                line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")
+            ]
+            videos += [os.path.join(base, path) for path in paths]
+    # Keep the first occurrence of each path
+    return list(dict.fromkeys(videos))
+
+class Checkpoint:
+    """JSON file of finished videos keyed by content hash, rewritten atomically after every video"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_done(self, digest):
+        with self._lock:
+            return self.entries.get(digest, {}).get("status") == "done"
+
+    def update(self, digest, entry):
+        with self._lock:
+            self.entries[digest] = entry
+            atomic_write_json(self.path, self.entries, indent=2)
+
+def process_video(video_path, digest, args, on_stage=None):
+    """Run the whole pipeline on one video and return its combined results and per-stage timings.
+
+    on_stage(name) is called as each of the detect, cut and analyze stages starts.
+    """
+    report = on_stage or (lambda name: None)
+    timings = {}
+    report("detect")
+    started = time.perf_counter()
+    # Rally ranges of an interrupted run come from the job journal, so segments and results line up
+    timestamps = default_journal.timestamps(digest)
+    if timestamps is None:
+        timestamps = detect_rallies(video_path)
+        default_journal.start_job(digest, timestamps, os.path.basename(video_path))
+    timings["detect"] = time.perf_counter() - started
+
+    report("cut")
+    started = time.perf_counter()
+    # Segments of an interrupted run are reused when their manifest still matches them
+    segments_root = os.path.join(args.output, "segments")
+    segments = load_manifest(match_folder(segments_root, digest), timestamps, mode=args.cut_mode)
+    if segments is None:
+        segments = split_video(video_path, timestamps, segments_root, mode=args.cut_mode, workers=args.cut_workers,
+                               match_id=digest)
+    timings["cut"] = time.perf_counter() - started
+
+    report("analyze")
+    started = time.perf_counter()
+    completed = analyze_match_rallies(segments, digest, max_concurrency=args.rally_concurrency,
+                                      proxy=PROXY_PRESETS.get(args.proxy), batch_rallies=args.batch_rallies)
+
+    results_by_idx, failures = {}, {}
+    for idx, segment_results, error in completed:
+        if error is not None or segment_results is None:
+            failures[idx + 1] = str(error) if error is not None else "Video processing failed"
+            continue
+        segment_results['segment_id'] = idx + 1
+        segment_results['match_id'] = digest
+        # The range the clip was actually cut from, after split_video sorted and merged the rallies
+        segment_results['timestamp'] = {"start": segments[idx]["start"], "end": segments[idx]["end"]}
+        results_by_idx[idx] = segment_results
+    timings["analyze"] = time.perf_counter() - started
+
+    all_results = [results_by_idx[idx] for idx in sorted(results_by_idx)]
+    combined_results = {
+        'individual_rallies': all_results,
+        'total_rallies': len(all_results),
+        'timestamps': timestamps,
+        'summary': calculate_summary(all_results),
+    }
+    return combined_results, failures, timings
+
+def run_one(video_path, args, checkpoint):
+    """Process one video unless the checkpoint already has it; returns its checkpoint entry"""
+    digest = file_digest(video_path)
+    if checkpoint.is_done(digest):
+        print(f"Skipping {video_path}: already analysed")
+        return None
+
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    output_path = os.path.join(args.output, f"{stem}-{digest[:8]}.json")
+    started = time.perf_counter()
+    entry = {"path": video_path, "output": output_path}
+    # Videos share the quota fairly and yield to interactive sessions in the same process
+    set_tenant(f"batch:{stem}", BATCH)
+    try:
+        combined_results, failures, timings = process_video(video_path, digest, args)
+        combined_results['timings'] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+        combined_results['usage'] = default_recorder.summary(match_id=digest)
+        combined_results['failed_rallies'] = failures
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(combined_results, f, indent=2)
+        default_store.save_match(digest, combined_results, os.path.basename(video_path))
+        # A video with failed rallies is retried on the next run; cached rallies cost nothing then
+        entry.update(status="failed" if failures else "done", timings=combined_results['timings'],
+                     rallies=combined_results['total_rallies'], failed_rallies=len(failures))
+    except Exception as e:
+        traceback.print_exc()
+        entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    checkpoint.update(digest, entry)
+    print(f"{entry['status']:>6}  {video_path}  ({entry['seconds']:.1f}s)")
+    return entry
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="video files, directories of videos or manifest files")
+    parser.add_argument("--output", default=OUTPUT_FOLDER)
+    parser.add_argument("--checkpoint", help="defaults to <output>/checkpoint.json")
+    parser.add_argument("--workers", type=int, default=2, help="videos processed at the same time")
+    parser.add_argument("--rally-concurrency", type=int, default=4, help="Gemini requests in flight per video")
+    parser.add_argument("--cut-mode", default="smart", choices=CUT_MODES)
+    parser.add_argument("--cut-workers", type=int, default=1)
+    parser.add_argument("--proxy", choices=list(PROXY_PRESETS))
+    parser.add_argument("--batch-rallies", action="store_true", help="send several rallies per Gemini request")
+    args = parser.parse_args()
+
+    gemini_client.configure()
+    os.makedirs(args.output, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output, "checkpoint.json"))
+
+    videos = collect_videos(args.sources)
+    print(f"{len(videos)} videos to process with {args.workers} worker(s)")
+    started = time.perf_counter()
+    entries = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_one, video_path, args, checkpoint) for video_path in videos]
+        for future in as_completed(futures):
+            entries.append(future.result())
+
+    processed = [entry for entry in entries if entry is not None]
+    failed = [entry for entry in processed if entry["status"] != "done"]
+    print(f"Processed {len(processed)} videos ({len(videos) - len(processed)} skipped, {len(failed)} failed) "
+          f"in {time.perf_counter() - started:.1f}s")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
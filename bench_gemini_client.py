@@ -0,0 +1,117 @@
+"""
+Connection reuse benchmark for gemini_client.PooledAdapter.
+
+Sends the same request load to a local keep-alive HTTP server that charges a fixed setup cost on
+every new connection (standing in for the TCP + TLS handshake to the Gemini endpoint) and a fixed
+latency per request. Requests go out in waves of N at once, like the pipeline's upload, polling
+and generate rounds over a match's segments, with three client setups:
+
+  new session   a fresh requests.Session per call (nothing is reused)
+  default pool  one shared Session with requests' default adapter (10 connections per host)
+  pooled        one shared Session with PooledAdapter(--pool-size)
+
+$ python bench_gemini_client.py --threads 8 16 32 --waves 10
+"""
+
+import time
+import logging
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from gemini_client import PooledAdapter
+
+MODES = ("new session", "default pool", "pooled")
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    setup_cost = 0.05
+    latency = 0.02
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with Handler.lock:
+            Handler.connections += 1
+        time.sleep(self.setup_cost)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        body = b'{"candidates": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+def make_session(mode, pool_size):
+    session = requests.Session()
+    if mode == "pooled":
+        session.mount("http://", PooledAdapter(pool_size))
+    return session
+
+def run_mode(mode, url, threads, waves, pool_size):
+    """Send `waves` bursts of `threads` concurrent requests; return (wall seconds, per-request latencies, connections)"""
+    shared = make_session(mode, pool_size)
+    payload = b"x" * 2048
+
+    def one(_):
+        session = requests.Session() if mode == "new session" else shared
+        started = time.perf_counter()
+        session.post(url, data=payload).raise_for_status()
+        elapsed = time.perf_counter() - started
+        if mode == "new session":
+            session.close()
+        return elapsed
+
+    Handler.connections = 0
+    started = time.perf_counter()
+    latencies = []
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for _ in range(waves):
+            latencies += pool.map(one, range(threads))
+    wall = time.perf_counter() - started
+    shared.close()
+    return wall, latencies, Handler.connections
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--waves", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=32)
+    parser.add_argument("--setup-cost", type=float, default=0.05, help="seconds per new connection")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per request")
+    args = parser.parse_args()
+
+    # The default pool warns on every connection it throws away; the connections column shows that
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+    Handler.setup_cost = args.setup_cost
+    Handler.latency = args.latency
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/gemini-1.5-flash:generateContent"
+
+    print(f"{'mode':<14}{'threads':>8}{'wall (s)':>10}{'req/s':>8}{'mean (ms)':>11}{'p95 (ms)':>10}{'connections':>13}")
+    try:
+        for threads in args.threads:
+            for mode in MODES:
+                wall, latencies, connections = run_mode(mode, url, threads, args.waves, args.pool_size)
+                p95 = statistics.quantiles(latencies, n=20)[-1]
+                print(f"{mode:<14}{threads:>8}{wall:>10.2f}{len(latencies) / wall:>8.0f}"
+                      f"{statistics.mean(latencies) * 1000:>11.1f}{p95 * 1000:>10.1f}{connections:>13}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
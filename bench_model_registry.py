@@ -0,0 +1,65 @@
+"""
+Microbenchmark of the per-segment setup cost of an analysis request: building the response
+schema and GenerativeModel and deriving the result cache key, with and without the shared
+model registry. Runs offline; no request is sent to Gemini.
+
+$ python bench_model_registry.py --segments 200
+"""
+
+import time
+import argparse
+import google.generativeai as genai
+from model_registry import ModelRegistry
+from result_cache import make_key
+from segment_video import MODEL_NAME, CONFIG_NAME, SYSTEM_INSTRUCTION, ANALYSIS_PROMPT, get_generation_config
+
+VIDEO_DIGEST = "0" * 64
+
+
+def per_segment_rebuild():
+    """What every segment used to pay: a fresh schema, model and config serialization"""
+    generation_config = get_generation_config()
+    make_key(VIDEO_DIGEST, MODEL_NAME, SYSTEM_INSTRUCTION, ANALYSIS_PROMPT, generation_config)
+    return genai.GenerativeModel(
+        model_name=MODEL_NAME,
+        generation_config=generation_config,
+        system_instruction=SYSTEM_INSTRUCTION
+    )
+
+
+def per_segment_shared(registry):
+    """What a segment pays with the registry: two dictionary lookups"""
+    fingerprint = registry.fingerprint(CONFIG_NAME, get_generation_config)
+    make_key(VIDEO_DIGEST, MODEL_NAME, SYSTEM_INSTRUCTION, ANALYSIS_PROMPT, fingerprint)
+    return registry.model(MODEL_NAME, CONFIG_NAME, get_generation_config, SYSTEM_INSTRUCTION)
+
+
+def timed(fn, segments):
+    started = time.perf_counter()
+    for _ in range(segments):
+        fn()
+    return (time.perf_counter() - started) / segments
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=200)
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    started = time.perf_counter()
+    per_segment_shared(registry)
+    first = time.perf_counter() - started
+
+    before = timed(per_segment_rebuild, args.segments)
+    after = timed(lambda: per_segment_shared(registry), args.segments)
+
+    print(f"{'setup':<22}{'per segment (ms)':>18}")
+    print(f"{'rebuild every call':<22}{before * 1000:>18.3f}")
+    print(f"{'registry, first call':<22}{first * 1000:>18.3f}")
+    print(f"{'registry, cached':<22}{after * 1000:>18.3f}")
+    print(f"speedup: {before / after:.0f}x, saved {(before - after) * args.segments * 1000:.0f} ms over {args.segments} segments")
+
+
+if __name__ == "__main__":
+    main()
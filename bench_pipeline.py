@@ -0,0 +1,123 @@
+"""
+End-to-end throughput benchmark of the rally analysis loop against the local Gemini stand-in.
+
+Runs segment_video's upload -> wait -> generate -> parse path over synthetic rally clips in
+serial, concurrent and batched mode and reports rallies per minute. Nothing leaves the machine
+and no quota is used; delays are those of fake_gemini.FakeGemini, scaled down by --time-scale.
+The client's own poll intervals and retry backoff are not scaled, so compare runs made with the
+same settings rather than reading rallies/min as an absolute figure.
+
+Requests still go through request_scheduler.default_scheduler. Its quota is lifted for the run
+unless --rpm / --tpm are given, in which case that quota (on the scaled clock) caps rallies/min.
+
+$ python bench_pipeline.py --rallies 24 --concurrency 1 4 8 --error-rate 0.05
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+# Keep the benchmark's cache, upload registry and metrics away from the real ones; these are
+# read when the pipeline modules are imported
+_WORK_DIR = tempfile.mkdtemp(prefix="bench-pipeline-")
+os.environ["ANALYSIS_CACHE_DIR"] = os.path.join(_WORK_DIR, "cache")
+os.environ["UPLOAD_REGISTRY_PATH"] = os.path.join(_WORK_DIR, "uploads.json")
+os.environ["GEMINI_METRICS_PATH"] = ""
+
+from fake_gemini import FakeGemini
+from concurrent_analysis import analyze_concurrently
+from segment_video import run_analysis, analyze_in_batches
+from request_scheduler import default_scheduler, TOKENS_PER_MINUTE
+
+CLIP_BYTES = 256 * 1024
+CLIP_SECONDS = 20
+UNLIMITED_RPM = 10 ** 9
+UNLIMITED_TPM = 10 ** 15
+
+
+def make_clips(count, folder):
+    """Write clips with random content, so every run uploads and analyses them afresh"""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for idx in range(count):
+        path = os.path.join(folder, f"segment_{idx + 1:03d}.mp4")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(CLIP_BYTES))
+        paths.append(path)
+    return paths
+
+
+def run_mode(mode, concurrency, clips):
+    """Analyse every clip once and return (seconds, rallies analysed, rallies failed)"""
+    started = time.perf_counter()
+    if mode == "batched":
+        completed = analyze_in_batches(clips, [CLIP_SECONDS] * len(clips), max_concurrency=concurrency)
+    else:
+        completed = analyze_concurrently(clips, run_analysis, max_concurrency=concurrency)
+    ok = failed = 0
+    for _, result, error in completed:
+        if error is None and result is not None:
+            ok += 1
+        else:
+            failed += 1
+    return time.perf_counter() - started, ok, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rallies", type=int, default=24)
+    parser.add_argument("--modes", nargs="+", default=["serial", "concurrent", "batched"],
+                        choices=["serial", "concurrent", "batched"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8],
+                        help="in-flight requests for the concurrent and batched modes")
+    parser.add_argument("--processing-delay", type=float, default=10.0, help="seconds until an upload is ACTIVE")
+    parser.add_argument("--response-latency", type=float, default=20.0, help="seconds per generate call")
+    parser.add_argument("--upload-latency", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with 429/503")
+    parser.add_argument("--time-scale", type=float, default=0.05,
+                        help="multiplier on every simulated delay, to keep runs short")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rpm", type=int, default=0, help="scheduler requests per minute (default: unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="scheduler tokens per minute (default: unlimited)")
+    args = parser.parse_args()
+
+    # The quota window shrinks with the simulated delays
+    if args.rpm or args.tpm:
+        default_scheduler.set_limits(args.rpm or UNLIMITED_RPM, args.tpm or TOKENS_PER_MINUTE,
+                                     period=60 * args.time_scale)
+        print(f"Scheduler quota: {args.rpm or 'unlimited'} requests/min, {args.tpm or TOKENS_PER_MINUTE} tokens/min; "
+              f"rallies/min cannot exceed it")
+    else:
+        default_scheduler.set_limits(UNLIMITED_RPM, UNLIMITED_TPM)
+        print("Scheduler quota: unlimited")
+
+    runs = []
+    for mode in args.modes:
+        for concurrency in ([1] if mode == "serial" else args.concurrency):
+            runs.append((mode, concurrency))
+
+    print(f"{'mode':<12}{'in flight':>10}{'wall (s)':>10}{'ok':>6}{'failed':>8}{'rallies/min':>13}{'requests':>10}{'errors':>8}")
+    for run_idx, (mode, concurrency) in enumerate(runs):
+        clips = make_clips(args.rallies, os.path.join(_WORK_DIR, f"run{run_idx}"))
+        fake = FakeGemini(
+            processing_delay=args.processing_delay * args.time_scale,
+            upload_latency=args.upload_latency * args.time_scale,
+            response_latency=args.response_latency * args.time_scale,
+            error_rate=args.error_rate,
+            seed=args.seed,
+        )
+        with fake:
+            seconds, ok, failed = run_mode(mode, concurrency, clips)
+        # Rallies per minute at real-world latency
+        per_minute = ok / (seconds / args.time_scale) * 60
+        print(f"{mode:<12}{concurrency:>10}{seconds:>10.2f}{ok:>6}{failed:>8}{per_minute:>13.1f}"
+              f"{fake.counters['requests']:>10}{fake.counters['errors']:>8}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        shutil.rmtree(_WORK_DIR, ignore_errors=True)
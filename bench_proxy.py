@@ -0,0 +1,60 @@
+"""
+Benchmark the pre-upload proxy stage against uploading the original video.
+
+For each proxy setting this measures the proxy build time, upload time, server-side
+processing wait and the prompt tokens the video costs. Needs GEMINI_API_KEY; every
+uploaded file is deleted afterwards.
+
+$ python bench_proxy.py /path/to/match.mp4
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import google.generativeai as genai
+import gemini_client
+from analysis_proxy import PROXY_PRESETS, make_proxy
+from file_waiter import wait_for_file_active
+
+
+def measure(video_path, model):
+    """Upload one file and return (size_mb, upload_s, processing_s, tokens)"""
+    started = time.perf_counter()
+    video_file = genai.upload_file(video_path, mime_type="video/mp4")
+    uploaded = time.perf_counter()
+    try:
+        video_file = wait_for_file_active(video_file)
+        processed = time.perf_counter()
+        tokens = model.count_tokens([video_file]).total_tokens
+    finally:
+        genai.delete_file(video_file.name)
+    return os.path.getsize(video_path) / 1e6, uploaded - started, processed - uploaded, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path")
+    parser.add_argument("--presets", nargs="+", default=list(PROXY_PRESETS), choices=list(PROXY_PRESETS))
+    parser.add_argument("--model", default="gemini-1.5-flash")
+    args = parser.parse_args()
+
+    gemini_client.configure()
+    model = genai.GenerativeModel(model_name=args.model)
+
+    rows = [("original", 0.0) + measure(args.video_path, model)]
+    with tempfile.TemporaryDirectory(prefix="bench-proxy-") as work_dir:
+        for name in args.presets:
+            started = time.perf_counter()
+            proxy = make_proxy(args.video_path, output_folder=work_dir, **PROXY_PRESETS[name])
+            build = time.perf_counter() - started
+            rows.append((name, build) + measure(proxy["path"], model))
+
+    print()
+    print(f"{'setting':<10}{'build (s)':>10}{'size (MB)':>11}{'upload (s)':>12}{'wait (s)':>10}{'tokens':>10}{'total (s)':>11}")
+    for name, build, size, upload, wait, tokens in rows:
+        print(f"{name:<10}{build:>10.1f}{size:>11.1f}{upload:>12.1f}{wait:>10.1f}{tokens:>10}{build + upload + wait:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Multi-tenant load test of request_scheduler against a simulated quota-enforcing endpoint.
+
+Several tenants (Streamlit sessions and batch jobs) each analyse a number of rallies with
+analyze_concurrently, against an endpoint that answers 429 once the requests or tokens sent in
+the last minute exceed its quota, as the Gemini API does. Runs once with every tenant going
+straight at the endpoint (retries and backoff only) and once through a RequestScheduler with the
+same limits, and reports throughput, 429s and per-tenant completion times. --time-scale speeds
+the clock up, so a few seconds of wall time cover several minutes of quota.
+
+$ python bench_scheduler.py --rpm 15 --tenants interactive:6 interactive:6 batch:30
+"""
+
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from google.api_core import exceptions as api_exceptions
+from concurrent_analysis import analyze_concurrently
+from request_scheduler import RequestScheduler, set_tenant, PRIORITIES
+
+class QuotaEndpoint:
+    """Accepts a request only while the last (scaled) minute stays within rpm and tpm"""
+
+    def __init__(self, rpm, tpm, latency, time_scale):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency
+        self.window = 60 * time_scale
+        self.sent = deque()     # (time, tokens)
+        self.lock = threading.Lock()
+        self.errors = 0
+
+    def generate(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            while self.sent and self.sent[0][0] <= now - self.window:
+                self.sent.popleft()
+            if len(self.sent) + 1 > self.rpm or sum(t for _, t in self.sent) + tokens > self.tpm:
+                self.errors += 1
+                raise api_exceptions.ResourceExhausted("Quota exceeded")
+            self.sent.append((now, tokens))
+        time.sleep(self.latency * random.uniform(0.8, 1.2))
+        return tokens
+
+def run(tenants, endpoint, scheduler, args):
+    """Run every tenant's rallies at once; return (wall seconds, {tenant: seconds until its last rally})"""
+    finished = {}
+
+    def run_tenant(name, priority, rallies):
+        set_tenant(name, priority)
+        started = time.monotonic()
+
+        def analyze(idx):
+            tokens = int(random.uniform(0.5, 1.5) * args.tokens)
+            if scheduler is None:
+                return endpoint.generate(tokens)
+            with scheduler.reserve(tokens) as slot:
+                slot.used_tokens = endpoint.generate(tokens)
+                return slot.used_tokens
+
+        for _, _, error in analyze_concurrently(range(rallies), analyze, max_concurrency=args.concurrency,
+                                                base_delay=2.0 * args.time_scale, max_retries=10):
+            if error is not None:
+                print(f"{name}: rally failed after retries: {error}")
+        finished[name] = time.monotonic() - started
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=run_tenant, args=tenant) for tenant in tenants]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started, finished
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rpm", type=int, default=15)
+    parser.add_argument("--tpm", type=int, default=1_000_000)
+    parser.add_argument("--tokens", type=int, default=10_000, help="mean tokens per request")
+    parser.add_argument("--tenants", nargs="+", default=["interactive:6", "interactive:6", "batch:30"],
+                        help="priority:rallies for each tenant")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight per tenant")
+    parser.add_argument("--latency", type=float, default=20.0, help="seconds per request")
+    parser.add_argument("--time-scale", type=float, default=0.05)
+    args = parser.parse_args()
+
+    tenants = []
+    for idx, spec in enumerate(args.tenants):
+        priority, rallies = spec.split(":")
+        if priority not in PRIORITIES:
+            parser.error(f"Unknown priority {priority!r}")
+        tenants.append((f"{priority}-{idx + 1}", priority, int(rallies)))
+    total = sum(rallies for _, _, rallies in tenants)
+
+    for label in ("unscheduled", "scheduled"):
+        endpoint = QuotaEndpoint(args.rpm, args.tpm, args.latency * args.time_scale, args.time_scale)
+        # The scheduler's quota window shrinks with the endpoint's
+        scheduler = None if label == "unscheduled" else RequestScheduler(
+            args.rpm, args.tpm, period=60 * args.time_scale)
+        wall, finished = run(tenants, endpoint, scheduler, args)
+        per_minute = total / (wall / args.time_scale) * 60
+        print(f"{label}: {total} rallies in {wall / args.time_scale:.0f}s simulated "
+              f"({per_minute:.1f}/min, quota {args.rpm}/min), {endpoint.errors} x 429")
+        for name, _, rallies in tenants:
+            print(f"    {name:<16}{rallies:>4} rallies, done after {finished[name] / args.time_scale:>6.0f}s")
+
+if __name__ == "__main__":
+    main()
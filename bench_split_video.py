@@ -0,0 +1,68 @@
+"""
+Benchmark the rally cutting modes of segment_rallies.split_video on a synthetic clip.
+
+$ python bench_split_video.py --duration 120
+"""
+
+import os
+import time
+import argparse
+import tempfile
+from segment_rallies import split_video, run_ffmpeg, CUT_MODES
+
+
+def make_synthetic_clip(path, duration, fps=30, gop_seconds=2):
+    """Render a 720p test pattern with a sine tone, using a fixed GOP like broadcast footage"""
+    run_ffmpeg([
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate={fps}:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+        "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps * gop_seconds),
+        "-keyint_min", str(fps * gop_seconds), "-sc_threshold", "0",
+        "-c:a", "aac", "-shortest",
+        path,
+    ])
+
+
+def make_rallies(duration, rally_seconds=7.3, gap_seconds=3.1):
+    """Lay out rallies with boundaries that do not line up with the GOP grid"""
+    rallies = []
+    start = 1.7
+    while start + rally_seconds < duration:
+        rallies.append({"start": start, "end": start + rally_seconds})
+        start += rally_seconds + gap_seconds
+    return {"rallies": rallies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=int, default=120, help="length of the synthetic clip in seconds")
+    parser.add_argument("--modes", nargs="+", default=list(CUT_MODES), choices=CUT_MODES)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="worker counts to compare")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-split-") as work_dir:
+        source = os.path.join(work_dir, "match.mp4")
+        make_synthetic_clip(source, args.duration)
+        timestamps = make_rallies(args.duration)
+        print(f"Synthetic clip: {args.duration}s, {os.path.getsize(source) / 1e6:.1f} MB, "
+              f"{len(timestamps['rallies'])} rallies")
+
+        results = []
+        for mode in args.modes:
+            for workers in args.workers:
+                output_folder = os.path.join(work_dir, f"{mode}-{workers}")
+                started = time.perf_counter()
+                manifest = split_video(source, timestamps, output_folder=output_folder, mode=mode, workers=workers)
+                elapsed = time.perf_counter() - started
+                results.append((mode, workers, elapsed, sum(entry["size_bytes"] for entry in manifest)))
+
+        baseline = next((elapsed for mode, workers, elapsed, _ in results if mode == "reencode" and workers == 1), None)
+        print()
+        print(f"{'mode':<10}{'workers':>8}{'wall (s)':>10}{'speedup':>10}{'size (MB)':>12}")
+        for mode, workers, elapsed, size in results:
+            speedup = f"{baseline / elapsed:.1f}x" if baseline else "-"
+            print(f"{mode:<10}{workers:>8}{elapsed:>10.2f}{speedup:>10}{size / 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
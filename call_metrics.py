@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+METRICS_PATH = os.getenv("GEMINI_METRICS_PATH", "gemini_calls.jsonl")
+PHASES = ("proxy", "upload", "processing_wait", "queue", "generate", "parse")
+
+class CallRecord:
+    """Token usage and per-phase wall-clock time of one Gemini analysis call"""
+
+    def __init__(self, label, match_id=None):
+        self.label = label
+        self.match_id = match_id
+        self.started_at = time.time()
+        self.phases = {}
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.total_tokens = 0
+        self.cached = False
+        self.error = None
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block and add it to the named phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def record_usage(self, response):
+        """Copy the token counts from a generate_content / send_message response"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_token_count
+        self.response_tokens += usage.candidates_token_count
+        self.total_tokens += usage.total_token_count
+
+    def to_dict(self):
+        return {
+            "label": self.label,
+            "match_id": self.match_id,
+            "started_at": self.started_at,
+            "cached": self.cached,
+            "error": self.error,
+            "prompt_tokens": self.prompt_tokens,
+            "response_tokens": self.response_tokens,
+            "total_tokens": self.total_tokens,
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "wall_seconds": round(sum(self.phases.values()), 4),
+        }
+
+class MetricsRecorder:
+    """Collects CallRecords in memory and appends each finished one to a JSON lines file"""
+
+    def __init__(self, path=METRICS_PATH):
+        self.path = path
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, label, match_id=None):
+        """Context manager yielding a CallRecord that is saved when the block exits, even on error"""
+        record = CallRecord(label, match_id)
+        try:
+            yield record
+        except Exception as e:
+            record.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.finish(record)
+
+    def finish(self, record):
+        entry = record.to_dict()
+        with self._lock:
+            self.records.append(entry)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def summary(self, match_id=None):
+        """Aggregate the calls recorded by this process, optionally for a single match"""
+        with self._lock:
+            records = [r for r in self.records if match_id is None or r["match_id"] == match_id]
+        return summarize(records)
+
+    def logged_summary(self, match_id=None):
+        """Aggregate every call in the JSON lines file, which all processes (the analysis workers
+        included) append to, optionally for a single match"""
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue    # a line another process is still writing
+        except (OSError, TypeError):
+            pass
+        return summarize([r for r in records if match_id is None or r.get("match_id") == match_id])
+
+def summarize(records):
+    """Totals, token counts and per-phase timings of a list of CallRecord dicts"""
+    summary = {
+        "calls": len(records),
+        "cached": sum(r["cached"] for r in records),
+        "errors": sum(r["error"] is not None for r in records),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in records),
+        "response_tokens": sum(r["response_tokens"] for r in records),
+        "total_tokens": sum(r["total_tokens"] for r in records),
+        "wall_seconds": sum(r["wall_seconds"] for r in records),
+        "phases": {},
+    }
+    for name in PHASES:
+        timings = [r["phases"][name] for r in records if name in r["phases"]]
+        if timings:
+            summary["phases"][name] = {
+                "total": sum(timings),
+                "mean": sum(timings) / len(timings),
+                "max": max(timings),
+            }
+    return summary
+
+def render_summary(container, summary, title="Gemini usage"):
+    """Draw a summary from MetricsRecorder.summary on a Streamlit container (st, st.sidebar, an expander...)"""
+    container.subheader(title)
+    col1, col2, col3 = container.columns(3)
+    col1.metric("Calls", summary["calls"], f"{summary['cached']} cached", delta_color="off")
+    col2.metric("Total tokens", f"{summary['total_tokens']:,}")
+    col3.metric("Wall time (s)", f"{summary['wall_seconds']:.1f}")
+    container.caption(f"Prompt tokens: {summary['prompt_tokens']:,} · Response tokens: {summary['response_tokens']:,}"
+                      f" · Errors: {summary['errors']}")
+    if summary["phases"]:
+        container.table({
+            "phase": list(summary["phases"]),
+            "total (s)": [round(p["total"], 2) for p in summary["phases"].values()],
+            "mean (s)": [round(p["mean"], 2) for p in summary["phases"].values()],
+            "max (s)": [round(p["max"], 2) for p in summary["phases"].values()],
+        })
+
+default_recorder = MetricsRecorder()
@@ -0,0 +1,65 @@
+import time
+import random
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.api_core import exceptions as api_exceptions
+
+# Errors worth retrying: quota (429) and transient server-side failures
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+)
+
+_cooldown_lock = threading.Lock()
+_cooldown_until = 0.0
+
+def _wait_for_cooldown():
+    """Block while another worker is backing off from a rate-limit error"""
+    with _cooldown_lock:
+        remaining = _cooldown_until - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+
+def _start_cooldown(delay):
+    """Make every worker pause, not just the one that hit the quota"""
+    global _cooldown_until
+    with _cooldown_lock:
+        _cooldown_until = max(_cooldown_until, time.monotonic() + delay)
+
+def call_with_backoff(fn, *args, max_retries=5, base_delay=2.0, max_delay=60.0, **kwargs):
+    """Call fn, retrying rate-limit and transient errors with exponential backoff and full jitter"""
+    for attempt in range(max_retries + 1):
+        _wait_for_cooldown()
+        try:
+            return fn(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if isinstance(e, api_exceptions.TooManyRequests):
+                _start_cooldown(delay)
+            print(f"{type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def analyze_concurrently(items, analyze_fn, max_concurrency=4, **backoff):
+    """Run analyze_fn over items on a bounded thread pool.
+
+    Yields (index, result, error) tuples as soon as each item finishes, so callers can
+    render progressively; index is the item's position in items, so results can be put
+    back into their original order. Workers run in a copy of the caller's context, so they
+    reserve Gemini requests as the caller's request_scheduler tenant.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, call_with_backoff, analyze_fn, item, **backoff): idx
+            for idx, item in enumerate(items)
+        }
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                yield idx, future.result(), None
+            except Exception as e:
+                yield idx, None, e
@@ -0,0 +1,227 @@
+"""
+In-process stand-in for the parts of the Gemini API this project uses, for offline load tests.
+
+FakeGemini.install() replaces genai.upload_file, get_file, delete_file and GenerativeModel with
+fakes that simulate upload time, the PROCESSING -> ACTIVE file state transition, response latency
+and injected errors, and answer with schema-valid canned analysis JSON (jsonformatter.txt by
+default). Batched requests ("Segment <id>:" labels) get one tagged entry per clip, streaming is
+supported and free-form prompts get plain text.
+
+    with FakeGemini(processing_delay=2, response_latency=5, error_rate=0.05):
+        run_analysis("video_segments/segment_001.mp4")
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import datetime
+import threading
+from types import SimpleNamespace
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+import model_registry
+
+CANNED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jsonformatter.txt")
+FILE_LIFETIME = datetime.timedelta(hours=48)
+STREAM_CHUNKS = 8
+_SEGMENT_LABEL = re.compile(r"^Segment (\d+):$")
+
+def load_canned_analysis(path=CANNED_PATH):
+    """Load a sample analysis and bring it to the current schema ("Rally N" keys become match.Rallies)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        analysis = json.load(f)
+    match = analysis["match"]
+    rally_keys = sorted((key for key in match if key.startswith("Rally ")), key=lambda key: int(key.split()[1]))
+    if rally_keys:
+        match["Rallies"] = [match.pop(key) for key in rally_keys]
+    match["rally_count"] = len(match.get("Rallies", []))
+    return analysis
+
+class FakeGemini:
+    """Simulated Gemini backend; every delay is in seconds and jittered by +/- latency_jitter"""
+
+    def __init__(self, processing_delay=2.0, upload_latency=0.2, response_latency=5.0, error_rate=0.0,
+                 processing_failure_rate=0.0, latency_jitter=0.2, canned=None, seed=None):
+        self.processing_delay = processing_delay
+        self.upload_latency = upload_latency
+        self.response_latency = response_latency
+        self.error_rate = error_rate
+        self.processing_failure_rate = processing_failure_rate
+        self.latency_jitter = latency_jitter
+        self.canned = canned if canned is not None else load_canned_analysis()
+        self.random = random.Random(seed)
+        self.files = {}
+        self.counters = {"uploads": 0, "get_file": 0, "requests": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._saved = None
+
+    # Installation
+
+    def install(self):
+        """Patch the genai module in place; cached GenerativeModel instances are dropped"""
+        self._saved = {name: getattr(genai, name) for name in ("upload_file", "get_file", "delete_file", "GenerativeModel")}
+        genai.upload_file = self.upload_file
+        genai.get_file = self.get_file
+        genai.delete_file = self.delete_file
+        genai.GenerativeModel = self.model
+        model_registry.default_models.clear()
+        return self
+
+    def uninstall(self):
+        for name, value in (self._saved or {}).items():
+            setattr(genai, name, value)
+        model_registry.default_models.clear()
+        self._saved = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    # Helpers
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds * self.random.uniform(1 - self.latency_jitter, 1 + self.latency_jitter))
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _maybe_fail(self):
+        if self.random.random() < self.error_rate:
+            self._count("errors")
+            error = self.random.choice([api_exceptions.ResourceExhausted, api_exceptions.ServiceUnavailable])
+            raise error("Injected by FakeGemini")
+
+    def _snapshot(self, name):
+        with self._lock:
+            entry = self.files.get(name)
+        if entry is None:
+            raise api_exceptions.NotFound(f"File {name} not found")
+        if time.monotonic() - entry["created"] < entry["processing_delay"]:
+            state = "PROCESSING"
+        else:
+            state = "FAILED" if entry["fails"] else "ACTIVE"
+        return SimpleNamespace(state=SimpleNamespace(name=state), **entry["file"])
+
+    # File API
+
+    def upload_file(self, path, mime_type=None, display_name=None, **kwargs):
+        self._count("uploads")
+        self._sleep(self.upload_latency)
+        self._maybe_fail()
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            self.files[name] = {
+                "created": time.monotonic(),
+                "processing_delay": self.processing_delay * self.random.uniform(1 - self.latency_jitter, 1 + self.latency_jitter),
+                "fails": self.random.random() < self.processing_failure_rate,
+                "file": {
+                    "name": name,
+                    "uri": f"https://fake-gemini.local/v1beta/{name}",
+                    "display_name": display_name or os.path.basename(path),
+                    "mime_type": mime_type,
+                    "size_bytes": os.path.getsize(path),
+                    "create_time": now,
+                    "expiration_time": now + FILE_LIFETIME,
+                },
+            }
+        return self._snapshot(name)
+
+    def get_file(self, name, **kwargs):
+        self._count("get_file")
+        return self._snapshot(name)
+
+    def delete_file(self, name, **kwargs):
+        with self._lock:
+            self.files.pop(getattr(name, "name", name), None)
+
+    def model(self, model_name=None, generation_config=None, system_instruction=None, **kwargs):
+        return FakeModel(self, model_name, generation_config or {}, system_instruction)
+
+    # Generation
+
+    def respond(self, generation_config, parts, stream=False):
+        """Answer one generate_content / send_message call"""
+        self._count("requests")
+        files = [part for part in parts if hasattr(part, "uri")]
+        for file in files:
+            state = self._snapshot(file.name).state.name
+            if state != "ACTIVE":
+                raise api_exceptions.FailedPrecondition(f"File {file.name} is not in an ACTIVE state ({state})")
+        self._maybe_fail()
+
+        text = self._response_text(generation_config, parts)
+        video_bytes = sum(getattr(file, "size_bytes", 0) or 0 for file in files)
+        usage = SimpleNamespace(
+            prompt_token_count=video_bytes // 1000 + sum(len(p) for p in parts if isinstance(p, str)) // 4,
+            candidates_token_count=len(text) // 4,
+        )
+        usage.total_token_count = usage.prompt_token_count + usage.candidates_token_count
+        return FakeResponse(self, text, usage, stream)
+
+    def _response_text(self, generation_config, parts):
+        if generation_config.get("response_mime_type") != "application/json":
+            return "Fake insights: both players covered the court well; see the rally breakdown for details."
+        schema = generation_config.get("response_schema")
+        # Schemas are content.Schema protos here and plain dicts in gemini_badminton_1
+        properties = (schema.get("properties") if isinstance(schema, dict) else getattr(schema, "properties", None)) or {}
+        if "segments" in properties:
+            labels = [_SEGMENT_LABEL.match(part) for part in parts if isinstance(part, str)]
+            segment_ids = [int(label.group(1)) for label in labels if label]
+            return json.dumps({"segments": [dict(self.canned, segment_id=segment_id) for segment_id in segment_ids]})
+        if "rallies" in properties:
+            return json.dumps({"rallies": [{"start": rally.get("from"), "end": rally.get("to")}
+                                           for rally in self.canned["match"].get("Rallies", [])]})
+        return json.dumps(self.canned)
+
+class FakeResponse:
+    """Response with .text and .usage_metadata; iterating it yields the text in chunks, as stream=True does"""
+
+    def __init__(self, backend, text, usage_metadata, stream):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self._backend = backend
+        if not stream:
+            backend._sleep(backend.response_latency)
+
+    def __iter__(self):
+        size = max(1, -(-len(self.text) // STREAM_CHUNKS))
+        for start in range(0, len(self.text), size):
+            self._backend._sleep(self._backend.response_latency / STREAM_CHUNKS)
+            yield SimpleNamespace(text=self.text[start:start + size])
+
+class FakeModel:
+    def __init__(self, backend, model_name, generation_config, system_instruction):
+        self.backend = backend
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        parts = contents if isinstance(contents, list) else [contents]
+        return self.backend.respond(self.generation_config, parts, stream)
+
+    def start_chat(self, history=None):
+        return FakeChat(self, history or [])
+
+    def count_tokens(self, contents):
+        parts = contents if isinstance(contents, list) else [contents]
+        video_bytes = sum(getattr(part, "size_bytes", 0) or 0 for part in parts)
+        return SimpleNamespace(total_tokens=video_bytes // 1000)
+
+class FakeChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, content, stream=False, **kwargs):
+        parts = [part for message in self.history for part in message.get("parts", [])]
+        parts += content if isinstance(content, list) else [content]
+        return self.model.backend.respond(self.model.generation_config, parts, stream)
@@ -0,0 +1,53 @@
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+
+INITIAL_INTERVAL = 0.5
+MAX_INTERVAL = 10.0
+BACKOFF_FACTOR = 1.6
+DEFAULT_TIMEOUT = 15 * 60
+
+class FileProcessingError(ValueError):
+    """Raised when Gemini reports that an uploaded file failed to process"""
+
+def wait_for_files_active(files, timeout=DEFAULT_TIMEOUT, initial_interval=INITIAL_INTERVAL,
+                          max_interval=MAX_INTERVAL, jitter=0.25, on_poll=None):
+    """Poll a batch of uploaded files until every one is ACTIVE and return the refreshed files in order.
+
+    Polling starts at initial_interval and backs off exponentially (with +/- jitter) up to
+    max_interval; all still-processing files are re-fetched concurrently in each round.
+    on_poll(pending_count, elapsed_seconds) is called before every sleep.
+    Raises FileProcessingError if a file fails and TimeoutError once timeout elapses.
+    """
+    files = list(files)
+    started = time.monotonic()
+    interval = initial_interval
+
+    with ThreadPoolExecutor(max_workers=min(8, max(1, len(files)))) as pool:
+        while True:
+            for idx, file in enumerate(files):
+                if file.state.name not in ("ACTIVE", "PROCESSING"):
+                    raise FileProcessingError(f"File {file.name} failed to process ({file.state.name})")
+
+            pending = [idx for idx, file in enumerate(files) if file.state.name == "PROCESSING"]
+            if not pending:
+                return files
+
+            elapsed = time.monotonic() - started
+            if elapsed >= timeout:
+                raise TimeoutError(f"{len(pending)} file(s) still processing after {elapsed:.0f}s")
+            if on_poll is not None:
+                on_poll(len(pending), elapsed)
+
+            delay = interval * random.uniform(1 - jitter, 1 + jitter)
+            time.sleep(min(delay, max(0.0, timeout - elapsed)))
+            interval = min(max_interval, interval * BACKOFF_FACTOR)
+
+            refreshed = pool.map(genai.get_file, [files[idx].name for idx in pending])
+            for idx, file in zip(pending, refreshed):
+                files[idx] = file
+
+def wait_for_file_active(file, **kwargs):
+    """Single-file convenience wrapper around wait_for_files_active"""
+    return wait_for_files_active([file], **kwargs)[0]
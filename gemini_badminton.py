@@ -1,240 +1,30 @@
 import os
-import time
-import json
-import google.generativeai as genai
-from google.ai.generativelanguage_v1beta.types import content
-from dotenv import load_dotenv
+import gemini_client
 import streamlit as st
 from segment_rallies import split_video
-from glob import glob
+from media_storage import save_stream_by_digest
+from analysis_queue import default_queue
 
 
 # Initialize constants
 MEDIA_FOLDER = 'medias'
+JOB_POLL_SECONDS = 2
 
 def init_app():
     """Initialize the application settings and configurations"""
     if not os.path.exists(MEDIA_FOLDER):
         os.makedirs(MEDIA_FOLDER)
     
-    load_dotenv()
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    gemini_client.configure()
     
     # Initialize session state for storing analysis results
     if 'analysis_results' not in st.session_state:
         st.session_state['analysis_results'] = None
 
-def get_generation_config():
-    """Return the generation configuration for Gemini model"""
-    return {
-    "temperature": 1,
-    "top_p": 0.90, 
-    "top_k": 64,
-    "response_schema": content.Schema(
-        type=content.Type.OBJECT,
-        required=["match"],
-        properties={
-            "match": content.Schema(
-                type=content.Type.OBJECT,
-                properties={
-                    "Player1": content.Schema(type=content.Type.STRING),
-                    "Player2": content.Schema(type=content.Type.STRING),
-                    "Player1 Score": content.Schema(type=content.Type.INTEGER),
-                    "Player2 Score": content.Schema(type=content.Type.INTEGER),
-                    "rally_count": content.Schema(type=content.Type.INTEGER),
-                    "Rallies": content.Schema(
-                        type=content.Type.ARRAY,
-                        items=content.Schema(
-                            type=content.Type.OBJECT,
-                            required=["from", "to", "rally_shots_count", "Court Reach", "Footwork", "Stamina", "Fouls", "Smashes"],
-                            properties={
-                                "from": content.Schema(type=content.Type.STRING),
-                                "to": content.Schema(type=content.Type.STRING),
-                                "rally_shots_count": content.Schema(type=content.Type.INTEGER),
-                                "Court Reach": content.Schema(
-                                    type=content.Type.OBJECT,
-                                    required=["Player1", "Player2"],
-                                    properties={
-                                        "Player1": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["Description", "Timestamp"],
-                                            properties={
-                                                "Description": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                        "Player2": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["Description", "Timestamp"],
-                                            properties={
-                                                "Description": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                    },
-                                ),
-                                "Footwork": content.Schema(
-                                    type=content.Type.OBJECT,
-                                    required=["Player1", "Player2"],
-                                    properties={
-                                        "Player1": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["Description", "Timestamp"],
-                                            properties={
-                                                "Description": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                        "Player2": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["Description", "Timestamp"],
-                                            properties={
-                                                "Description": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                    },
-                                ),
-                                "Stamina": content.Schema(
-                                    type=content.Type.OBJECT,
-                                    required=["Player1", "Player2"],
-                                    properties={
-                                        "Player1": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["Description", "percentage"],
-                                            properties={
-                                                "Description": content.Schema(type=content.Type.STRING),
-                                                "percentage": content.Schema(type=content.Type.INTEGER),
-                                            },
-                                        ),
-                                        "Player2": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["Description", "percentage"],
-                                            properties={
-                                                "Description": content.Schema(type=content.Type.STRING),
-                                                "percentage": content.Schema(type=content.Type.INTEGER),
-                                            },
-                                        ),
-                                    },
-                                ),
-                                "Fouls": content.Schema(
-                                    type=content.Type.OBJECT,
-                                    required=["Player1", "Player2"],
-                                    properties={
-                                        "Player1": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["count", "Description", "Timestamp"],
-                                            properties={
-                                                "count": content.Schema(type=content.Type.INTEGER),
-                                                "Description": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                        "Player2": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["count", "Description", "Timestamp"],
-                                            properties={
-                                                "count": content.Schema(type=content.Type.INTEGER),
-                                                "Description": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                    },
-                                ),
-                                "Smashes": content.Schema(
-                                    type=content.Type.OBJECT,
-                                    required=["Player1", "Player2"],
-                                    properties={
-                                        "Player1": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["count", "Timestamp"],
-                                            properties={
-                                                "count": content.Schema(type=content.Type.INTEGER),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                        "Player2": content.Schema(
-                                            type=content.Type.OBJECT,
-                                            required=["count", "Timestamp"],
-                                            properties={
-                                                "count": content.Schema(type=content.Type.INTEGER),
-                                                "Timestamp": content.Schema(type=content.Type.ARRAY, items=content.Schema(type=content.Type.STRING)),
-                                            },
-                                        ),
-                                    },
-                                ),
-                            },
-                        ),
-                    ),
-                },
-            ),
-        },
-    ),
-    "response_mime_type": "application/json",
-}
-
 def save_uploaded_file(uploaded_file):
-    """Save the uploaded file to the media folder and return the file path"""
-    file_path = os.path.join(MEDIA_FOLDER, uploaded_file.name)
-    with open(file_path, 'wb') as f:
-        f.write(uploaded_file.getbuffer())
-    return file_path
-
-def analyze_video(file_path):
-    """Process the video using Gemini API and return analysis results"""
-    with st.spinner("Initializing Gemini model..."):
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=get_generation_config(),
-            system_instruction="""As a badminton analysis expert, evaluate each rally in the provided match video based on official badminton rules.
-                                Begin a new rally when the shuttlecock touches the floor or if there is a noticeable pause between points. 
-                                For each rally, assess the following:
-                                Court Reach: Determine how effectively each player covers the court, noting any areas of strength or weakness.
-                                Footwork: Analyze the players' footwork techniques and agility, highlighting any breakdowns or strengths.
-                                Stamina: Assess the players’ endurance, noting if either shows signs of fatigue.
-                                Smashes: Identify and timestamp any smashes, along with their effectiveness and player position.
-                                Provide timestamps for specific actions within each rally and track the score incrementally for both players across rallies. 
-                                Format the output according to the provided JSON schema, capturing every element accurately."""
-        )
-
-    with st.spinner("Uploading video to Gemini..."):
-        video_file = genai.upload_file(file_path, mime_type="video/mp4")
-        
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    # Wait for file processing
-    while video_file.state.name == "PROCESSING":
-        status_text.text("Processing video... Please wait.")
-        time.sleep(10)
-        video_file = genai.get_file(video_file.name)
-        progress_bar.progress(0.5)
-
-    if video_file.state.name == "FAILED":
-        st.error("Video processing failed. Please try again.")
-        return None
-
-    with st.spinner("Analyzing video..."):
-        chat_session = model.start_chat(
-            history=[
-                {
-                    "role": "user",
-                    "parts": [video_file],
-                }
-            ]
-        )
-
-        response = chat_session.send_message(
-            """Analyze the provided badminton video and output detailed observations and description for each rally.
-            A new rally starts each time a player scores a point. Include analysis of each player's court reach, footwork,
-            stamina, fouls, smashes, and provide timestamps. Count the shots per rally and dynamically count all rallies within
-            the match. Use the provided JSON schema."""
-        )
-        
-        progress_bar.progress(1.0)
-        status_text.text("Analysis complete!")
-        
-        return json.loads(response.text)
+    """Write the (in-memory) uploaded file to the media folder and return its path and content hash.
+    The file is named after the hash, so a queued job's video is never replaced by another upload."""
+    return save_stream_by_digest(uploaded_file, MEDIA_FOLDER, os.path.splitext(uploaded_file.name)[1].lower())
 
 def display_analysis_results(results):
     """Display the analysis results in a structured format"""
@@ -259,44 +49,72 @@ def display_analysis_results(results):
     # Display rally details
     st.header("Rally Analysis")
     for idx, rally in enumerate(match_data['Rallies'], 1):
-        with st.expander(f"Rally {idx} ({rally['from']} - {rally['to']})"):
-            st.metric("Shots in Rally", rally['rally_shots_count'])
-            
-            # Court Reach Analysis
-            st.subheader("Court Reach")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.write("Player 1")
-                for desc, time in zip(rally['Court Reach']['Player1']['Description'],
-                                    rally['Court Reach']['Player1']['Timestamp']):
-                    st.write(f"- {desc} ({time})")
-            with col2:
-                st.write("Player 2")
-                for desc, time in zip(rally['Court Reach']['Player2']['Description'],
-                                    rally['Court Reach']['Player2']['Timestamp']):
-                    st.write(f"- {desc} ({time})")
+        display_rally(idx, rally)
 
-            # Stamina Analysis
-            st.subheader("Stamina")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.progress(rally['Stamina']['Player1']['percentage'] / 100)
-                st.write(rally['Stamina']['Player1']['Description'])
-            with col2:
-                st.progress(rally['Stamina']['Player2']['percentage'] / 100)
-                st.write(rally['Stamina']['Player2']['Description'])
-
-            # Smashes Analysis
-            st.subheader("Smashes")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Player 1 Smashes", rally['Smashes']['Player1']['count'])
-                if rally['Smashes']['Player1']['Timestamp']:
-                    st.write("Timestamps:", ", ".join(rally['Smashes']['Player1']['Timestamp']))
-            with col2:
-                st.metric("Player 2 Smashes", rally['Smashes']['Player2']['count'])
-                if rally['Smashes']['Player2']['Timestamp']:
-                    st.write("Timestamps:", ", ".join(rally['Smashes']['Player2']['Timestamp']))
+def display_rally(idx, rally):
+    """Display one rally of the analysis as an expander"""
+    with st.expander(f"Rally {idx} ({rally['from']} - {rally['to']})"):
+        st.metric("Shots in Rally", rally['rally_shots_count'])
+        
+        # Court Reach Analysis
+        st.subheader("Court Reach")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.write("Player 1")
+            for desc, time in zip(rally['Court Reach']['Player1']['Description'],
+                                rally['Court Reach']['Player1']['Timestamp']):
+                st.write(f"- {desc} ({time})")
+        with col2:
+            st.write("Player 2")
+            for desc, time in zip(rally['Court Reach']['Player2']['Description'],
+                                rally['Court Reach']['Player2']['Timestamp']):
+                st.write(f"- {desc} ({time})")
+
+        # Stamina Analysis
+        st.subheader("Stamina")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.progress(rally['Stamina']['Player1']['percentage'] / 100)
+            st.write(rally['Stamina']['Player1']['Description'])
+        with col2:
+            st.progress(rally['Stamina']['Player2']['percentage'] / 100)
+            st.write(rally['Stamina']['Player2']['Description'])
+
+        # Smashes Analysis
+        st.subheader("Smashes")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Player 1 Smashes", rally['Smashes']['Player1']['count'])
+            if rally['Smashes']['Player1']['Timestamp']:
+                st.write("Timestamps:", ", ".join(rally['Smashes']['Player1']['Timestamp']))
+        with col2:
+            st.metric("Player 2 Smashes", rally['Smashes']['Player2']['count'])
+            if rally['Smashes']['Player2']['Timestamp']:
+                st.write("Timestamps:", ", ".join(rally['Smashes']['Player2']['Timestamp']))
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job(job_id):
+    """Poll a queued video analysis, showing rallies as the worker's response streams them in and the
+    full results once it is done"""
+    job = default_queue.get(job_id)
+    if job is None:
+        st.session_state['job_id'] = None
+        return
+    if job['status'] == "queued":
+        st.info(f"Waiting for an analysis worker ({default_queue.position(job_id)} job(s) ahead)...")
+        if not default_queue.workers():
+            st.warning("No analysis worker is running; start one with `python analysis_worker.py`.")
+    elif job['status'] == "running":
+        st.progress(job['progress'], text=job['message'] or "Analyzing video...")
+        for idx, rally in enumerate(default_queue.rallies(job_id), 1):
+            display_rally(idx, rally)
+    elif job['status'] == "failed":
+        st.error(f"An error occurred during analysis: {job['error']}")
+        st.session_state['job_id'] = None
+    else:
+        st.session_state['job_id'] = None
+        st.session_state['analysis_results'] = job['result']
+        st.rerun()
 
 def main():
     
@@ -326,26 +144,26 @@ def main():
     st.write("Upload a badminton match video for detailed analysis of player performance, rallies, and statistics.")
     
     uploaded_file = st.file_uploader("Upload a video file", type=["mp4", "mov", "avi", "mkv"])
+    # The analysis workers look results up, so the counters are theirs
+    cache_stats = default_queue.worker_totals()["cache"]
+    st.sidebar.caption(f"Result cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
     
     if uploaded_file:
         st.video(uploaded_file)
         
         if st.button("Analyze Video"):
-            file_path = save_uploaded_file(uploaded_file)
+            file_path, video_digest = save_uploaded_file(uploaded_file)
             # split_video(file_path, timestamps)         
 
-            
-            try:
-                results = analyze_video(file_path)
-                if results:
-                    st.session_state['analysis_results'] = results
-                    display_analysis_results(results)
-            except Exception as e:
-                st.error(f"An error occurred during analysis: {str(e)}")
-            finally:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-    
+            # An analysis_worker process runs the job, so it survives reruns and refreshes of this page
+            st.session_state['job_id'] = default_queue.enqueue(
+                "video", video_digest, file_path, uploaded_file.name, options={"delete_source": True}
+            )
+            st.session_state['analysis_results'] = None
+
+    if st.session_state.get('job_id') is not None:
+        show_job(st.session_state['job_id'])
+
     # Display previous results if they exist
     elif st.session_state['analysis_results']:
         display_analysis_results(st.session_state['analysis_results'])
@@ -5,18 +5,21 @@ $ pip install google.ai.generativelanguage
 """
 
 import os
-import time
-import google.generativeai as genai
 from google.ai.generativelanguage_v1beta.types import content
-from dotenv import load_dotenv
+import gemini_client
 import os
 import json
-
-# Load environment variables from .env file
-load_dotenv()
-
+from upload_registry import default_registry
+import file_waiter
+from rally_timestamps import normalize_timestamps
+from analysis_proxy import make_proxy, remap_analysis_timestamps
+from call_metrics import default_recorder
+from model_registry import default_models
+from request_scheduler import default_scheduler, estimate_tokens
+
+# Load environment variables from .env file and configure the shared client
 print("Configuring Gemini")
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+gemini_client.configure()
 print("Configured Gemini")
 
 
@@ -25,23 +28,19 @@ def upload_to_gemini(path, mime_type=None):
 
   See https://ai.google.dev/gemini-api/docs/prompting_with_media
   """
-  file = genai.upload_file(path, mime_type=mime_type)
+  file = default_registry.get_or_upload(path, mime_type=mime_type)
   print(f"Uploaded file '{file.display_name}' as: {file.uri}")
   return file
 
 def wait_for_files_active(files):
   
   print("Waiting for file processing...")
-  for name in (file.name for file in files):
-    file = genai.get_file(name)
-    while file.state.name == "PROCESSING":
-      print(".", end="", flush=True)
-      time.sleep(10)
-      file = genai.get_file(name)
-    if file.state.name != "ACTIVE":
-      raise Exception(f"File {file.name} failed to process")
+  files = file_waiter.wait_for_files_active(
+    files, on_poll=lambda pending, elapsed: print(".", end="", flush=True)
+  )
   print("...all files ready")
   print()
+  return files
 
 
 print("Configuring Json for output")
@@ -259,19 +258,19 @@ def create_generation_segment_config():
 
 
 # Create the model with system instructions
+GENERATION_CONFIGS = {
+    "segment": create_generation_segment_config,
+    "analyze": create_generation_analyze_config,
+}
+
 def create_model(system_instruction,config_type):
-    if config_type=="segment":
-        print("cosses",config_type)
-        generation_config = create_generation_segment_config()
-    elif config_type=="analyze":
-        generation_config = create_generation_analyze_config()
-        
-    model = genai.GenerativeModel(
-        model_name="gemini-1.5-flash",
-        generation_config=generation_config,
-        system_instruction=system_instruction,
+    # Schema and model are built once per config type and instruction, then shared
+    return default_models.model(
+        "gemini-1.5-flash",
+        f"gemini_badminton_1.{config_type}",
+        GENERATION_CONFIGS[config_type],
+        system_instruction,
     )
-    return model
 
 
 # Start chat session with the model
@@ -286,36 +285,57 @@ def start_chat_session(model, files):
     )
 
 # Send message to get timestamps in JSON format
-def get_rally_timestamps(chat_session,prompt):
-    response = chat_session.send_message(
-        prompt
-    )
+def get_rally_timestamps(chat_session,prompt,call=None,files=()):
+    with default_scheduler.reserve(estimate_tokens(files, prompt)) as slot:
+        response = chat_session.send_message(
+            prompt
+        )
+        slot.record_usage(response)
+    if call is not None:
+        call.record_usage(response)
     return response.text
 
 # Main function to execute the analysis
-def analyze_video(file_path,system_instruction,config_type,prompt):
+def analyze_video(file_path,system_instruction,config_type,prompt,proxy=None):
     
     model = create_model(system_instruction,config_type)
     
-    # You may need to update the file paths
-    files = [
-    upload_to_gemini(file_path, mime_type="video/mp4"),
-    ]
-
-    # Some files have a processing delay. Wait for them to be ready.
-    wait_for_files_active(files)
-  
-    
-    chat_session = start_chat_session(model, files)
-    rally_timestamps_json = get_rally_timestamps(chat_session,prompt)
-    
-    print("Rally Timestamps JSON:", rally_timestamps_json)
+    with default_recorder.track(f"{config_type}:{os.path.basename(file_path)}", file_path) as call:
+        # Optionally upload a downscaled analysis copy (see analysis_proxy.PROXY_PRESETS)
+        proxy_info = None
+        if proxy is not None:
+            with call.phase("proxy"):
+                proxy_info = make_proxy(file_path, **proxy)
+        upload_path = proxy_info["path"] if proxy_info is not None else file_path
+        
+        # You may need to update the file paths
+        with call.phase("upload"):
+            files = [
+            upload_to_gemini(upload_path, mime_type="video/mp4"),
+            ]
+
+        # Some files have a processing delay. Wait for them to be ready.
+        with call.phase("processing_wait"):
+            files = wait_for_files_active(files)
+      
+        
+        with call.phase("generate"):
+            chat_session = start_chat_session(model, files)
+            rally_timestamps_json = get_rally_timestamps(chat_session,prompt,call,files)
+        
+        print("Rally Timestamps JSON:", rally_timestamps_json)
+        
+        # Convert JSON string to a Python dictionary if necessary
+        with call.phase("parse"):
+            if isinstance(rally_timestamps_json, str):
+                rally_timestamps_dict = json.loads(rally_timestamps_json)
+            else:
+                rally_timestamps_dict = rally_timestamps_json  # Already a dict
+            
+            if proxy_info is not None:
+                rally_timestamps_dict = remap_analysis_timestamps(rally_timestamps_dict, proxy_info)
     
-    # Convert JSON string to a Python dictionary if necessary
-    if isinstance(rally_timestamps_json, str):
-        rally_timestamps_dict = json.loads(rally_timestamps_json)
-    else:
-        rally_timestamps_dict = rally_timestamps_json  # Already a dict
+    print("Token usage and timings:", json.dumps(default_recorder.summary(match_id=file_path), indent=2))
         
     return rally_timestamps_dict
 
@@ -364,7 +384,10 @@ def call_to_segment_video():
             
     final_json = analyze_video(file_path,system_instruction,config_type,prompt)
     
-    print(type(final_json))
+    # The model returns clock strings; convert them to validated, merged millisecond ranges
+    timestamps = normalize_timestamps(final_json)
+    print(json.dumps(timestamps, indent=2))
+    return timestamps
 
 
 
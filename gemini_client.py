@@ -0,0 +1,102 @@
+"""
+One place that configures the Gemini SDK for the whole process.
+
+Every entry point calls configure() instead of its own load_dotenv() / genai.configure(). With
+the REST transport each SDK service client gets a keep-alive connection pool sized for the number
+of rally segments in flight (requests' default keeps only 10 connections per host and throws the
+rest away, so more concurrent calls mean a new TLS handshake each), plus connect/read timeouts.
+connection_stats() reports how often connections were reused.
+"""
+
+import os
+import threading
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from google.auth.exceptions import DefaultCredentialsError
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+TRANSPORT = os.getenv("GEMINI_TRANSPORT", "rest")
+POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", 32))
+CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", 10))
+READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", 600))
+SERVICES = ("generative", "file", "model")
+
+_lock = threading.Lock()
+_configured = False
+_adapters = []
+_discovery_fetches = 0
+
+class PooledAdapter(HTTPAdapter):
+    """Keep-alive HTTPS adapter with a connection pool of pool_size and default timeouts"""
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        super().__init__(pool_connections=len(SERVICES), pool_maxsize=pool_size)
+
+    def send(self, request, timeout=None, **kwargs):
+        if not isinstance(timeout, tuple):
+            timeout = (self.connect_timeout, timeout or self.read_timeout)
+        return super().send(request, timeout=timeout, **kwargs)
+
+    def stats(self):
+        """Return (requests sent, connections opened) over every host pool of this adapter"""
+        pools = [self.poolmanager.pools[key] for key in self.poolmanager.pools.keys()]
+        return sum(pool.num_requests for pool in pools), sum(pool.num_connections for pool in pools)
+
+def _fetch_discovery_once(file_client):
+    """The SDK's FileServiceClient downloads the File API discovery document before every upload
+    (its cached copy is never marked as set); fetch it once per thread instead"""
+    setup = file_client._setup_discovery_api
+
+    def setup_once(metadata=()):
+        global _discovery_fetches
+        if getattr(file_client._local, "discovery_api", None) is None:
+            setup(metadata)
+            with _lock:
+                _discovery_fetches += 1
+
+    file_client._setup_discovery_api = setup_once
+
+def configure(api_key=None, transport=TRANSPORT, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+              read_timeout=READ_TIMEOUT):
+    """Load .env and configure the SDK once per process; later calls are no-ops"""
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        load_dotenv()
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"), transport=transport)
+        _configured = True
+
+    if transport != "rest":
+        return
+    try:
+        clients = {service: genai_client._client_manager.get_default_client(service) for service in SERVICES}
+    except DefaultCredentialsError:
+        # No key yet: leave the SDK to raise its own error on the first request
+        return
+    for service, client in clients.items():
+        adapter = PooledAdapter(pool_size, connect_timeout, read_timeout)
+        client._transport._session.mount("https://", adapter)
+        with _lock:
+            _adapters.append(adapter)
+    _fetch_discovery_once(clients["file"])
+
+def connection_stats():
+    """Return request, new-connection and discovery-fetch counts since configure()"""
+    with _lock:
+        adapters = list(_adapters)
+        discovery_fetches = _discovery_fetches
+    requests_sent = connections = 0
+    for adapter in adapters:
+        sent, opened = adapter.stats()
+        requests_sent += sent
+        connections += opened
+    return {
+        "requests": requests_sent,
+        "connections_opened": connections,
+        "reuse_ratio": round(1 - connections / requests_sent, 3) if requests_sent else None,
+        "discovery_fetches": discovery_fetches,
+    }
@@ -0,0 +1,114 @@
+"""
+Durable per-rally job journal, so an interrupted match analysis resumes instead of restarting.
+
+Jobs are keyed by the video's content hash: the detected rally ranges are stored once per video,
+and every rally records its status, segment file, remote Gemini file and parsed result. A rerun
+on the same video reuses the rally ranges and only analyses rallies that are not done yet.
+"""
+
+import os
+import json
+import time
+from contextlib import closing
+from sqlite_store import SQLiteStore
+
+JOURNAL_PATH = os.getenv("JOB_JOURNAL_PATH", "analysis_jobs.db")
+STATUSES = ("pending", "running", "uploaded", "done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    video_digest TEXT PRIMARY KEY,
+    video_name TEXT,
+    timestamps TEXT NOT NULL,
+    created_at REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS rally_jobs (
+    video_digest TEXT NOT NULL REFERENCES jobs(video_digest) ON DELETE CASCADE,
+    rally_index INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    segment_path TEXT,
+    remote_file TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL,
+    PRIMARY KEY (video_digest, rally_index)
+);
+CREATE INDEX IF NOT EXISTS rally_jobs_status ON rally_jobs (video_digest, status);
+"""
+
+class JobJournal(SQLiteStore):
+    """SQLite journal of match and rally jobs"""
+
+    schema = SCHEMA
+    foreign_keys = True
+
+    def __init__(self, path=JOURNAL_PATH):
+        super().__init__(path)
+
+    def start_job(self, video_digest, timestamps, video_name=None):
+        """Record the rally ranges of a video and a pending entry for each rally; existing rallies are kept"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?)",
+                (video_digest, video_name, json.dumps(timestamps), now, now),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO rally_jobs (video_digest, rally_index, status, updated_at) VALUES (?, ?, 'pending', ?)",
+                [(video_digest, idx, now) for idx in range(len(timestamps['rallies']))],
+            )
+
+    def timestamps(self, video_digest):
+        """Return the rally ranges recorded for a video, or None if it has no job yet"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT timestamps FROM jobs WHERE video_digest = ?", (video_digest,)).fetchone()
+        return json.loads(row['timestamps']) if row else None
+
+    def mark(self, video_digest, rally_index, status, **fields):
+        """Update a rally's status and any of segment_path, remote_file, result and error"""
+        if status not in STATUSES:
+            raise ValueError(f"Unknown job status '{status}', expected one of {STATUSES}")
+        updates = {"status": status, "updated_at": time.time()}
+        for key, value in fields.items():
+            updates[key] = json.dumps(value) if key == "result" else value
+        assignments = ", ".join(f"{key} = ?" for key in updates)
+        if status == "running":
+            assignments += ", attempts = attempts + 1"
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"UPDATE rally_jobs SET {assignments} WHERE video_digest = ? AND rally_index = ?",
+                list(updates.values()) + [video_digest, rally_index],
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE video_digest = ?", (updates["updated_at"], video_digest))
+
+    def completed(self, video_digest):
+        """Return {rally_index: parsed result} of the rallies that are done"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT rally_index, result FROM rally_jobs WHERE video_digest = ? AND status = 'done'",
+                (video_digest,),
+            ).fetchall()
+        return {row['rally_index']: json.loads(row['result']) for row in rows}
+
+    def status_counts(self, video_digest):
+        """Return {status: number of rallies} for a video"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM rally_jobs WHERE video_digest = ? GROUP BY status",
+                (video_digest,),
+            ).fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def rallies(self, video_digest):
+        """Return every rally job of a video, in rally order, without the stored results"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT rally_index, status, segment_path, remote_file, error, attempts, updated_at FROM rally_jobs "
+                "WHERE video_digest = ? ORDER BY rally_index",
+                (video_digest,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+default_journal = JobJournal()
@@ -0,0 +1,63 @@
+import json
+
+class ArrayItemStream:
+    """Incrementally scans a JSON document and yields each element of one nested array once it closes.
+
+    path is the sequence of object keys leading to the array, e.g. ("match", "Rallies"). Feed the
+    document in arbitrary chunks; feed() returns the array elements completed by that chunk, parsed.
+    Everything else in the document is skipped, and the whole text is kept in self.text so the
+    caller can still json.loads it once the stream ends. Elements must be objects or arrays, which
+    holds for every array in the analysis schemas.
+    """
+
+    def __init__(self, path):
+        self.path = tuple(path)
+        self.text = ""
+        self._pos = 0
+        self._stack = []            # one [kind, key path, pending key] per open container
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string = None
+        self._item_start = None
+        self.count = 0
+
+    def feed(self, chunk):
+        self.text += chunk
+        items = []
+        text, stack = self.text, self._stack
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":" and stack and stack[-1][0] == "{":
+                stack[-1][2] = json.loads(self._last_string)
+            elif char in "{[":
+                if stack:
+                    parent_path, key = stack[-1][1], stack[-1][2]
+                    path = parent_path + (key,) if stack[-1][0] == "{" else parent_path
+                else:
+                    path = ()
+                # An element of the target array starts
+                if stack and stack[-1][0] == "[" and stack[-1][1] == self.path and self._item_start is None:
+                    self._item_start = (i, len(stack))
+                stack.append([char, path, None])
+            elif char in "}]":
+                stack.pop()
+                if self._item_start is not None and len(stack) == self._item_start[1]:
+                    items.append(json.loads(text[self._item_start[0]:i + 1]))
+                    self._item_start = None
+                    self.count += 1
+        self._pos = len(text)
+        return items
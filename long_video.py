@@ -0,0 +1,143 @@
+"""
+Chunked analysis of full-length matches.
+
+A long match is cut into overlapping time windows that are analysed independently (and in
+parallel), then stitched back into one result: timestamps are shifted to match time, every rally
+is kept only from the window whose core contains its start, so rallies in the overlaps are not
+counted twice, and each window's points are added onto the running score of the windows before it.
+
+    |----- window 0 -----|
+    |  core 0   |overlap |
+                |----- window 1 -----|
+                |  core 1   |overlap |
+"""
+
+import os
+import hashlib
+import tempfile
+from moviepy.editor import VideoFileClip
+from segment_rallies import export_segment, list_keyframes
+from result_cache import file_digest
+from analysis_proxy import map_analysis_timestamps
+from rally_timestamps import parse_timestamp, format_timestamp
+
+WINDOW_FOLDER = 'windows'
+LONG_VIDEO_SECONDS = 20 * 60     # videos longer than this are analysed in windows
+WINDOW_SECONDS = 10 * 60
+OVERLAP_SECONDS = 60             # longer than any rally, so one window always sees a rally whole
+
+WINDOW_PROMPT = """
+            This clip is part {number} of {total} of a longer match and starts at {start} match time; report every
+            timestamp relative to the start of this clip. Ignore a rally that is already in progress when the clip
+            starts. Report "Player1 Score" and "Player2 Score" as the points won in this clip only, counting only
+            rallies that start before {cutoff} in clip time; rallies after that are scored in the next part."""
+
+def video_duration(video_path):
+    with VideoFileClip(video_path) as clip:
+        return clip.duration
+
+def plan_windows(duration, window=WINDOW_SECONDS, overlap=OVERLAP_SECONDS):
+    """Split [0, duration) into windows of `window` seconds, each overlapping the next by `overlap`.
+
+    Returns dicts with start/end (match seconds) and core_end, the match time up to which the window
+    owns the rallies that start in it; the next window owns everything from there on.
+    """
+    if overlap >= window:
+        raise ValueError(f"Overlap ({overlap}s) must be shorter than the window ({window}s)")
+    stride = window - overlap
+    windows = []
+    start = 0.0
+    while True:
+        end = min(start + window, duration)
+        last = end >= duration
+        windows.append({
+            "index": len(windows),
+            "start": start,
+            "end": end,
+            "core_end": duration if last else start + stride,
+        })
+        if last:
+            return windows
+        start += stride
+
+def window_prompt(prompt, window, total):
+    """The analysis prompt with the instructions that let window results be stitched"""
+    return prompt + WINDOW_PROMPT.format(
+        number=window["index"] + 1,
+        total=total,
+        start=format_timestamp(window["start"] * 1000),
+        cutoff=format_timestamp((window["core_end"] - window["start"]) * 1000),
+    )
+
+def window_digest(video_digest, window):
+    """Stable id of one window of a video, used in place of the cut file's content hash, so its
+    cached analysis and uploaded file can be found before (or without) cutting it"""
+    return hashlib.sha256(f"{video_digest}:{window['start']:.3f}-{window['end']:.3f}".encode()).hexdigest()
+
+def cut_windows(video_path, windows, output_folder=WINDOW_FOLDER, digest=None):
+    """Cut every window to its own file (frame-accurate, stream-copying where possible).
+
+    Returns the folder and the paths, in window order. The folder is private to this call and
+    named after the video's content hash, so concurrent jobs never share one; the caller removes
+    it once the windows are analysed.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    folder = tempfile.mkdtemp(dir=output_folder, prefix=f"{(digest or file_digest(video_path))[:16]}-")
+    keyframes = list_keyframes(video_path)
+    return folder, [
+        export_segment(video_path, window["index"] + 1, window["start"], window["end"], folder, "smart", keyframes)["path"]
+        for window in windows
+    ]
+
+def _seconds(value):
+    try:
+        return parse_timestamp(value) / 1000
+    except (TypeError, ValueError):
+        return None
+
+def _overlap_ratio(a, b):
+    """Fraction of the shorter of two (start, end) ranges that the other one covers"""
+    shared = min(a[1], b[1]) - max(a[0], b[0])
+    shortest = min(a[1] - a[0], b[1] - b[0])
+    return shared / shortest if shortest > 0 else float(shared >= 0)
+
+def stitch_windows(window_results, windows):
+    """Merge per-window analyses (None for failed windows) into one match result in match time"""
+    match, rallies, window_scores = {}, [], []
+    score = {"Player1": 0, "Player2": 0}
+    for window, result in zip(windows, window_results):
+        data = (result or {}).get("match")
+        entry = {"index": window["index"], "start": window["start"], "end": window["end"],
+                 "score_before": dict(score), "failed": data is None}
+        window_scores.append(entry)
+        if data is None:
+            continue
+        for key in ("Player1", "Player2"):
+            match.setdefault(key, data.get(key))
+            score[key] += int(data.get(f"{key} Score") or 0)
+
+        offset_ms = int(round(window["start"] * 1000))
+        shifted = map_analysis_timestamps(data.get("Rallies", []), lambda ms: ms + offset_ms)
+        for rally in shifted:
+            start, end = _seconds(rally.get("from")), _seconds(rally.get("to"))
+            if start is None:
+                continue
+            # Owned by this window only if it starts in the window's core
+            if window["start"] <= start < window["core_end"]:
+                rallies.append((start, end if end is not None else start, rally))
+
+    rallies.sort(key=lambda item: item[0])
+    stitched = []
+    for start, end, rally in rallies:
+        # A rally cut at a window edge can still be reported by both windows with shifted bounds
+        if stitched and _overlap_ratio(stitched[-1][:2], (start, end)) > 0.5:
+            continue
+        stitched.append((start, end, rally))
+
+    match.update({
+        "Player1 Score": score["Player1"],
+        "Player2 Score": score["Player2"],
+        "rally_count": len(stitched),
+        "Rallies": [rally for _, _, rally in stitched],
+    })
+    return {"match": match, "windows": window_scores}
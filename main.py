@@ -1,8 +1,13 @@
 import os
-import time
 import google.generativeai as genai
 import streamlit as st
-from dotenv import load_dotenv
+import gemini_client
+from upload_registry import default_registry
+from file_waiter import wait_for_file_active
+from media_storage import save_stream
+from analysis_proxy import make_proxy, PROXY_PRESETS
+from call_metrics import default_recorder, render_summary
+from request_scheduler import default_scheduler, estimate_tokens, set_tenant, streamlit_tenant, INTERACTIVE
 
 MEDIA_FOLDER = 'medias'
 
@@ -10,34 +15,44 @@ def __init__():
     if not os.path.exists(MEDIA_FOLDER):
         os.makedirs(MEDIA_FOLDER)
 
-    load_dotenv()  ## load all the environment variables
-    api_key = os.getenv("GEMINI_API_KEY")
-    genai.configure(api_key=api_key)
+    gemini_client.configure()  ## loads the environment variables and the shared, pooled client
 
 def save_uploaded_file(uploaded_file):
-    """Save the uploaded file to the media folder and return the file path."""
+    """Write the (in-memory) uploaded file to the media folder and return its path and content hash."""
     file_path = os.path.join(MEDIA_FOLDER, uploaded_file.name)
-    with open(file_path, 'wb') as f:
-        f.write(uploaded_file.read())
-    return file_path
+    digest = save_stream(uploaded_file, file_path)
+    return file_path, digest
 
-def get_insights(video_path):
-    """Extract insights from the video using Gemini Flash."""
-    st.write(f"Processing video: {video_path}")
-
-    st.write(f"Uploading file...")
-    video_file = genai.upload_file(path=video_path)
-    st.write(f"Completed upload: {video_file.uri}")
-
-    while video_file.state.name == "PROCESSING":
-        st.write('Waiting for video to be processed.')
-        time.sleep(10)
-        video_file = genai.get_file(video_file.name)
+def get_insights(video_path, video_digest=None, proxy=None):
+    """Extract insights from the video using Gemini Flash.
 
-    if video_file.state.name == "FAILED":
-        raise ValueError(video_file.state.name)
+    proxy is an optional dict of analysis_proxy.make_proxy settings; the downscaled copy is uploaded instead.
+    """
+    st.write(f"Processing video: {video_path}")
+    match_id = video_digest
+
+    with default_recorder.track(os.path.basename(video_path), match_id) as call:
+        if proxy is not None:
+            st.write("Building analysis proxy...")
+            with call.phase("proxy"):
+                proxy_info = make_proxy(video_path, digest=video_digest, **proxy)
+            video_path, video_digest = proxy_info["path"], None
+            if proxy_info["speed"] != 1.0:
+                st.write(f"Timestamps refer to a {proxy_info['speed']:g}x proxy; multiply them by {proxy_info['speed']:g} for match time.")
+
+        st.write(f"Uploading file...")
+        with call.phase("upload"):
+            video_file = default_registry.get_or_upload(video_path, digest=video_digest)
+        st.write(f"Completed upload: {video_file.uri}")
+
+        status = st.empty()
+        with call.phase("processing_wait"):
+            video_file = wait_for_file_active(
+                video_file,
+                on_poll=lambda pending, elapsed: status.write(f'Waiting for video to be processed ({elapsed:.0f}s).')
+            )
     
-    prompt = """
+        prompt = """
             Analyze the badminton video to extract detailed insights on the following points:
 
             1. **Rally Duration**: Identify each rally, defined as the continuous gameplay between players from the start of a serve until the shuttlecock touches the floor. Measure the duration of each rally.
@@ -51,26 +66,36 @@ def get_insights(video_path):
             Provide a comprehensive summary of these aspects for each rally in the video, with timestamps and insights on gameplay flow.
         """
 
-    model = genai.GenerativeModel(model_name="models/gemini-1.5-flash")
+        model = genai.GenerativeModel(model_name="models/gemini-1.5-flash")
+
+        st.write("Waiting for a request slot...")
+        with call.phase("queue"):
+            slot = default_scheduler.reserve(estimate_tokens([video_file], prompt))
+        st.write("Making LLM inference request...")
+        with call.phase("generate"), slot:
+            response = model.generate_content([prompt, video_file],
+                                            request_options={"timeout": 600})
+            slot.record_usage(response)
+        call.record_usage(response)
+        st.write(f'Video processing complete')
+        st.subheader("Insights")
+        st.write(response.text)
+        # The uploaded file is kept (it expires server-side) so reruns can reuse it via the registry
 
-    st.write("Making LLM inference request...")
-    response = model.generate_content([prompt, video_file],
-                                    request_options={"timeout": 600})
-    st.write(f'Video processing complete')
-    st.subheader("Insights")
-    st.write(response.text)
-    genai.delete_file(video_file.name)
+    render_summary(st, default_recorder.summary(match_id=match_id), title="Gemini usage")
 
 
 def app():
     st.title("Badmition Insights Generator")
+    set_tenant(streamlit_tenant(), INTERACTIVE)
 
     uploaded_file = st.file_uploader("Upload a video file", type=["mp4", "avi", "mov", "mkv"])
+    proxy_name = st.sidebar.selectbox("Upload proxy", ["Original"] + list(PROXY_PRESETS))
 
     if uploaded_file is not None:
-        file_path = save_uploaded_file(uploaded_file)
+        file_path, video_digest = save_uploaded_file(uploaded_file)
         st.video(file_path)
-        get_insights(file_path)
+        get_insights(file_path, video_digest, proxy=PROXY_PRESETS.get(proxy_name))
         if os.path.exists(file_path):  ## Optional: Removing uploaded files from the temporary location
             os.remove(file_path)
 
@@ -0,0 +1,185 @@
+"""
+Match statistics over analysed rallies.
+
+The per-rally JSON returned by Gemini is flattened once into a columnar table of NumPy arrays
+(one row per rally), and every statistic is then computed with whole-array operations, so
+summaries over thousands of rallies from many matches stay cheap.
+"""
+
+import numpy as np
+from rally_timestamps import parse_timestamp
+
+PLAYERS = ("Player1", "Player2")
+DURATION_BINS = (0, 5, 10, 15, 20, 30, 45, 60, np.inf)   # seconds, for the rally length histogram
+
+def _seconds(value):
+    try:
+        return parse_timestamp(value) / 1000
+    except (TypeError, ValueError):
+        return np.nan
+
+def _count(rally, section, player, field="count"):
+    try:
+        return float(rally[section][player][field])
+    except (KeyError, TypeError, ValueError):
+        return np.nan
+
+def rally_table(results):
+    """Flatten segment results into a dict of equal-length NumPy columns, one row per rally.
+
+    results is a list of analysis results ({"match": {...}}), optionally carrying "match_id" and the
+    "timestamp" of the segment in the full video as added by segment_video.main. Rally from/to are
+    relative to their clip, so the segment start is added to place rallies on the match timeline.
+    Missing or malformed fields become NaN rather than dropping the rally.
+    """
+    match_ids, match_codes = [], {}
+    player_names = {}
+    rows = []
+    for result in results:
+        match = (result or {}).get("match")
+        if not match:
+            continue
+        match_id = result.get("match_id", 0)
+        if match_id not in match_codes:
+            match_codes[match_id] = len(match_ids)
+            match_ids.append(match_id)
+            player_names[match_id] = tuple(match.get(player, player) for player in PLAYERS)
+        offset = (result.get("timestamp") or {}).get("start", 0.0)
+        for rally in match.get("Rallies", []):
+            rows.append((
+                match_codes[match_id],
+                offset + _seconds(rally.get("from")),
+                offset + _seconds(rally.get("to")),
+                float(rally.get("rally_shots_count", np.nan)),
+                _count(rally, "Smashes", "Player1"), _count(rally, "Smashes", "Player2"),
+                _count(rally, "Fouls", "Player1"), _count(rally, "Fouls", "Player2"),
+                _count(rally, "Stamina", "Player1", "percentage"), _count(rally, "Stamina", "Player2", "percentage"),
+            ))
+
+    data = np.array(rows, dtype=np.float64).reshape(-1, 10)
+    return {
+        "match_ids": match_ids,
+        "player_names": [player_names[match_id] for match_id in match_ids],
+        "match": data[:, 0].astype(np.int64),
+        "start": data[:, 1],
+        "end": data[:, 2],
+        "duration": data[:, 2] - data[:, 1],
+        "shots": data[:, 3],
+        "smashes": data[:, 4:6],
+        "fouls": data[:, 6:8],
+        "stamina": data[:, 8:10],
+    }
+
+def _per_match_sum(values, match, n_matches):
+    """Sum a (rallies,) or (rallies, players) column per match, ignoring NaN"""
+    values = np.nan_to_num(values)
+    if values.ndim == 1:
+        return np.bincount(match, weights=values, minlength=n_matches)
+    return np.stack([np.bincount(match, weights=values[:, p], minlength=n_matches)
+                     for p in range(values.shape[1])], axis=1)
+
+def _positions(table, n_matches):
+    """Return each rally's 0-based position within its own match (by start time) and the rallies per match"""
+    match = table["match"]
+    order = np.lexsort((table["start"], match))
+    counts = np.bincount(match, minlength=n_matches)
+    position = np.empty(match.size)
+    position[order] = np.arange(match.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    return position, counts
+
+def _stamina_slope(table, position, n_matches):
+    """Least-squares stamina change per rally, per match and player"""
+    match, stamina = table["match"], table["stamina"]
+    valid = ~np.isnan(stamina)
+    x = np.where(valid, position[:, None], 0.0)
+    y = np.where(valid, stamina, 0.0)
+    n = _per_match_sum(valid.astype(np.float64), match, n_matches)
+    sx, sy = _per_match_sum(x, match, n_matches), _per_match_sum(y, match, n_matches)
+    sxx, sxy = _per_match_sum(x * x, match, n_matches), _per_match_sum(x * y, match, n_matches)
+    denominator = n * sxx - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+
+def _stats(values):
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return {"mean": 0.0, "median": 0.0, "p90": 0.0, "min": 0.0, "max": 0.0}
+    p50, p90 = np.percentile(values, [50, 90])
+    return {
+        "mean": float(values.mean()),
+        "median": float(p50),
+        "p90": float(p90),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+def _clean(value):
+    return None if np.isnan(value) else round(float(value), 3)
+
+def summarize(table):
+    """Compute duration distribution, per-player rates and stamina trends from a rally_table"""
+    match, duration = table["match"], table["duration"]
+    n_matches = len(table["match_ids"])
+    histogram, _ = np.histogram(duration[~np.isnan(duration)], bins=DURATION_BINS)
+
+    minutes = _per_match_sum(duration, match, n_matches) / 60
+    smashes = _per_match_sum(table["smashes"], match, n_matches)
+    fouls = _per_match_sum(table["fouls"], match, n_matches)
+    position, counts = _positions(table, n_matches)
+    slopes = _stamina_slope(table, position, n_matches)
+    rallies = counts.astype(np.float64)
+
+    # Mean stamina over the first and last quarter of each match's rallies
+    quarter = np.maximum(counts // 4, 1)[match]
+    stamina = table["stamina"]
+    early, late = position < quarter, position >= counts[match] - quarter
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stamina_early = _per_match_sum(np.where(early[:, None], stamina, np.nan), match, n_matches) / \
+            _per_match_sum((early[:, None] & ~np.isnan(stamina)).astype(np.float64), match, n_matches)
+        stamina_late = _per_match_sum(np.where(late[:, None], stamina, np.nan), match, n_matches) / \
+            _per_match_sum((late[:, None] & ~np.isnan(stamina)).astype(np.float64), match, n_matches)
+        smash_rate, foul_rate = smashes / rallies[:, None], fouls / rallies[:, None]
+        smashes_per_minute = smashes / minutes[:, None]
+
+    matches = []
+    for m, match_id in enumerate(table["match_ids"]):
+        players = {}
+        for p, key in enumerate(PLAYERS):
+            players[key] = {
+                "name": table["player_names"][m][p],
+                "smashes": int(smashes[m, p]),
+                "smashes_per_rally": _clean(smash_rate[m, p]),
+                "smashes_per_minute": _clean(smashes_per_minute[m, p]),
+                "fouls": int(fouls[m, p]),
+                "fouls_per_rally": _clean(foul_rate[m, p]),
+                "stamina_start": _clean(stamina_early[m, p]),
+                "stamina_end": _clean(stamina_late[m, p]),
+                "stamina_trend_per_rally": _clean(slopes[m, p]),
+            }
+        matches.append({
+            "match_id": match_id,
+            "rallies": int(rallies[m]),
+            "play_minutes": _clean(minutes[m]),
+            "player_statistics": players,
+        })
+
+    durations = _stats(duration)
+    return {
+        "total_points": int(match.size),
+        "total_matches": n_matches,
+        "average_rally_duration": round(durations["mean"], 2),
+        "longest_rally": round(durations["max"], 2),
+        "shortest_rally": round(durations["min"], 2),
+        "rally_duration": durations,
+        "duration_histogram": {
+            f"{lo:g}-{hi:g}s" if np.isfinite(hi) else f"{lo:g}s+": int(count)
+            for lo, hi, count in zip(DURATION_BINS[:-1], DURATION_BINS[1:], histogram)
+        },
+        "shots_per_rally": _stats(table["shots"]),
+        "player_statistics": matches[0]["player_statistics"] if n_matches == 1 else {},
+        "matches": matches,
+    }
+
+def calculate_summary(all_results):
+    """Summary statistics over all analysed rallies (of one or many matches)"""
+    return summarize(rally_table(all_results))
@@ -0,0 +1,49 @@
+import os
+import hashlib
+import tempfile
+from atomic_file import atomic_write
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+def save_stream(source, dest_path, chunk_size=COPY_CHUNK_SIZE):
+    """Copy a readable file-like object to dest_path and return the SHA-256 hex digest of its bytes.
+
+    The data is copied in fixed-size chunks and hashed on the way through, so the copy adds at
+    most one chunk on top of the source, and the video is never read a second time to hash it.
+    Peak memory is only independent of the video size when the source itself streams from disk
+    or the network: a Streamlit UploadedFile already holds the whole upload in memory, so for the
+    apps the ceiling is server.maxUploadSize. It is written to a temp file in the destination
+    folder and renamed into place, so readers never see a half-written file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+    with atomic_write(dest_path, 'wb', prefix='.upload-', suffix='.part') as f:
+        return _copy_hashed(source, f, chunk_size)
+
+def save_stream_by_digest(source, folder, suffix='', chunk_size=COPY_CHUNK_SIZE):
+    """Copy a readable file-like object into folder, named after the SHA-256 hex digest of its
+    bytes plus suffix, and return (path, digest).
+
+    Uploads that share a file name but not their content never overwrite each other, and saving
+    the same video again leaves an identical file in place. The name is only known once the
+    copy is done, so it is staged in a private folder and moved into place from there.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=folder, prefix='.upload-') as work_dir:
+        staged_path = os.path.join(work_dir, 'upload' + suffix)
+        with open(staged_path, 'wb') as f:
+            digest = _copy_hashed(source, f, chunk_size)
+        dest_path = os.path.join(folder, digest + suffix)
+        os.replace(staged_path, dest_path)
+    return dest_path, digest
+
+def _copy_hashed(source, f, chunk_size):
+    """Copy source into the open file f, hashing it on the way, and return the hex digest"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(chunk_size), b''):
+        digest.update(chunk)
+        f.write(chunk)
+    f.flush()
+    os.fsync(f.fileno())
+    return digest.hexdigest()
@@ -0,0 +1,53 @@
+import threading
+import google.generativeai as genai
+from result_cache import config_fingerprint
+
+class ModelRegistry:
+    """Builds each generation config and GenerativeModel once per process and shares it.
+
+    Generation configs are keyed by name and built by the supplied zero-argument builder on first
+    use; models are keyed by (model name, config name, system instruction). GenerativeModel holds
+    no per-request state, so one instance can serve every rally segment and worker thread.
+    """
+
+    def __init__(self):
+        self._configs = {}
+        self._fingerprints = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def config(self, config_name, builder):
+        """Return the generation config registered under config_name, building it on first use"""
+        with self._lock:
+            if config_name not in self._configs:
+                self._configs[config_name] = builder()
+            return self._configs[config_name]
+
+    def fingerprint(self, config_name, builder):
+        """Return the serialized form of a config, as used in result cache keys"""
+        generation_config = self.config(config_name, builder)
+        with self._lock:
+            if config_name not in self._fingerprints:
+                self._fingerprints[config_name] = config_fingerprint(generation_config)
+            return self._fingerprints[config_name]
+
+    def model(self, model_name, config_name, builder, system_instruction=None):
+        """Return the shared GenerativeModel for this model, config and system instruction"""
+        generation_config = self.config(config_name, builder)
+        key = (model_name, config_name, system_instruction)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = genai.GenerativeModel(
+                    model_name=model_name,
+                    generation_config=generation_config,
+                    system_instruction=system_instruction,
+                )
+            return self._models[key]
+
+    def clear(self):
+        with self._lock:
+            self._configs.clear()
+            self._fingerprints.clear()
+            self._models.clear()
+
+default_models = ModelRegistry()
@@ -0,0 +1,176 @@
+"""
+CPU-only rally segmentation: finds rally boundaries from motion and shuttle-hit sounds
+without uploading the match anywhere.
+
+$ python rally_detector.py match.mp4
+"""
+
+import re
+import sys
+import json
+import tempfile
+import subprocess
+import numpy as np
+from moviepy.config import get_setting
+from rally_timestamps import normalize_timestamps
+
+ANALYSIS_FPS = 5                 # frames per second decoded for the motion signal
+FRAME_SIZE = (160, 90)           # width, height the frames are downscaled to
+AUDIO_RATE = 8000                # mono sample rate for the onset signal
+AUDIO_HOP = 80                   # samples per audio energy frame (10 ms)
+FRAMES_PER_BLOCK = 256           # frames decoded and diffed per vectorized step
+
+MIN_ONSET_RISE = 0.7             # minimum jump in log energy for an onset (~2x amplitude)
+MIN_HIT_INTERVAL = 0.3           # seconds; shuttle hits closer than this are one onset
+HIT_WINDOW = 3.0                 # seconds over which hit density is measured
+MIN_HITS_PER_WINDOW = 2          # hits within HIT_WINDOW for the play to count as live
+MAX_GAP = 2.5                    # seconds of quiet tolerated inside one rally
+MIN_RALLY = 3.0                  # shorter candidates are dropped
+PADDING = 1.0                    # seconds added before the serve and after the last hit
+MOTION_ONLY_PERCENTILE = 60      # without an audio track, play is motion above this percentile
+
+def _ffmpeg_pipe(args):
+    cmd = [get_setting("FFMPEG_BINARY"), "-hide_banner", "-loglevel", "error", "-threads", "0"] + args
+    # stderr goes to a file, not a pipe nobody reads while stdout is drained
+    errors = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+    proc.errors = errors
+    return proc
+
+def _wait(proc, video_path):
+    """Wait for an ffmpeg pipe and raise if it failed, so a broken file never reads as a quiet match"""
+    returncode = proc.wait()
+    proc.errors.seek(0)
+    message = proc.errors.read().decode(errors='replace').strip()
+    proc.errors.close()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {video_path}: {message or f'exit code {returncode}'}")
+
+def has_audio(video_path):
+    """Whether the file has an audio stream, read from ffmpeg's stream banner"""
+    proc = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-i", video_path],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return re.search(r"Stream #\d+:\d+.*: Audio:", proc.stderr) is not None
+
+def motion_energy(video_path, fps=ANALYSIS_FPS, frame_size=FRAME_SIZE):
+    """Return the mean absolute frame difference per analysed frame, with scene cuts suppressed"""
+    width, height = frame_size
+    frame_bytes = width * height
+    proc = _ffmpeg_pipe([
+        "-i", video_path, "-an",
+        "-vf", f"fps={fps},scale={width}:{height}",
+        "-pix_fmt", "gray", "-f", "rawvideo", "-",
+    ])
+
+    energies = [np.zeros(1, dtype=np.float32)]
+    previous = None
+    while True:
+        raw = proc.stdout.read(frame_bytes * FRAMES_PER_BLOCK)
+        usable = len(raw) - len(raw) % frame_bytes
+        if usable == 0:
+            break
+        block = np.frombuffer(raw[:usable], dtype=np.uint8).reshape(-1, height, width).astype(np.int16)
+        if previous is not None:
+            block = np.concatenate([previous, block])
+        energies.append(np.abs(np.diff(block, axis=0)).mean(axis=(1, 2), dtype=np.float32))
+        previous = block[-1:]
+    _wait(proc, video_path)
+
+    energy = np.concatenate(energies)
+    # Camera cuts and replays produce a one-frame spike far above real player movement
+    if energy.size:
+        cut_level = np.percentile(energy, 99.5)
+        energy[energy >= cut_level] = np.median(energy)
+    return energy
+
+def hit_times(video_path, rate=AUDIO_RATE, hop=AUDIO_HOP):
+    """Return the times (seconds) of sharp audio onsets, i.e. likely racket-shuttle contacts, or
+    None when the file has no audio track"""
+    if not has_audio(video_path):
+        return None
+    proc = _ffmpeg_pipe(["-i", video_path, "-vn", "-ac", "1", "-ar", str(rate), "-f", "s16le", "-"])
+
+    block_bytes = hop * 2 * 4096
+    log_energy = []
+    while True:
+        raw = proc.stdout.read(block_bytes)
+        usable = len(raw) - len(raw) % (hop * 2)
+        if usable == 0:
+            break
+        samples = np.frombuffer(raw[:usable], dtype=np.int16).astype(np.float32).reshape(-1, hop)
+        log_energy.append(np.log1p(np.sqrt((samples * samples).mean(axis=1))))
+    _wait(proc, video_path)
+    if not log_energy:
+        return np.zeros(0)
+
+    energy = np.concatenate(log_energy)
+    # Onset strength: rise of each frame above the mean of the preceding 100 ms
+    context = 10
+    cumulative = np.concatenate([[0.0], np.cumsum(energy)])
+    idx = np.arange(energy.size)
+    lookback = np.minimum(idx, context)
+    window_sum = cumulative[idx] - cumulative[idx - lookback]
+    background = np.where(lookback > 0, window_sum / np.maximum(lookback, 1), energy)
+    onset = np.maximum(energy - background, 0)
+
+    mad = np.median(np.abs(onset - np.median(onset)))
+    threshold = max(MIN_ONSET_RISE, np.median(onset) + 6 * mad)
+    is_peak = onset > threshold
+    is_peak[1:-1] &= (onset[1:-1] >= onset[:-2]) & (onset[1:-1] >= onset[2:])
+    times = np.flatnonzero(is_peak) * hop / rate
+
+    # Keep only the first onset of each burst
+    hits = []
+    for t in times:
+        if not hits or t - hits[-1] >= MIN_HIT_INTERVAL:
+            hits.append(t)
+    return np.array(hits)
+
+def _runs(mask):
+    """Return (start, end) index pairs of the True runs in a boolean array, end exclusive"""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def detect_rallies(video_path, fps=ANALYSIS_FPS):
+    """Detect rallies and return them as {"rallies": [{"start": seconds, "end": seconds}, ...]}"""
+    motion = motion_energy(video_path, fps=fps)
+    hits = hit_times(video_path)
+    n_frames = motion.size
+    duration = n_frames / fps
+    if n_frames == 0:
+        return {"rallies": []}
+
+    # Players in a rally move more than between points; compare against the match's own baseline
+    window = max(1, int(HIT_WINDOW * fps))
+    smooth = np.convolve(motion, np.ones(window) / window, mode='same')
+
+    if hits is None:
+        # No audio to hear the shuttle: fall back to a stricter motion threshold alone
+        print(f"{video_path} has no audio track; detecting rallies from motion only")
+        live = smooth > np.percentile(smooth, MOTION_ONLY_PERCENTILE)
+    else:
+        # Hits per HIT_WINDOW seconds, evaluated at every analysed frame
+        hit_counts = np.bincount(np.minimum((hits * fps).astype(int), n_frames - 1), minlength=n_frames)
+        hit_density = np.convolve(hit_counts, np.ones(window), mode='same')
+        live = (hit_density >= MIN_HITS_PER_WINDOW) & (smooth > np.median(smooth))
+
+    # Bridge short pauses (high clears, shuttle out of shot) inside a rally
+    starts, ends = _runs(~live)
+    for start, end in zip(starts, ends):
+        if 0 < start and end < n_frames and (end - start) / fps <= MAX_GAP:
+            live[start:end] = True
+
+    rallies = []
+    for start, end in zip(*_runs(live)):
+        if (end - start) / fps < MIN_RALLY:
+            continue
+        rallies.append({
+            "start": round(max(0.0, float(start) / fps - PADDING), 2),
+            "end": round(min(duration, float(end) / fps + PADDING), 2),
+        })
+
+    # Padding can make neighbours touch; normalization folds them together
+    return normalize_timestamps({"rallies": rallies})
+
+if __name__ == "__main__":
+    print(json.dumps(detect_rallies(sys.argv[1]), indent=2))
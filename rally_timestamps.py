@@ -0,0 +1,93 @@
+import re
+
+# "SS", "MM:SS" or "HH:MM:SS", each optionally with a fractional second
+_CLOCK_RE = re.compile(r"^\s*(?:(\d+):)?(?:(\d+):)?(\d+(?:\.\d+)?)\s*$")
+
+def parse_timestamp(value, float_format="seconds"):
+    """Convert a rally timestamp to integer milliseconds.
+
+    Accepts numbers (seconds) and clock strings such as "13", "01:45", "00:00:13" or "1:02:03.5";
+    minutes and seconds must be below 60 when a higher field is given, so "1:75" is rejected.
+    float_format="minutes.seconds" reads numbers the way the early hand-written rally lists were
+    typed, i.e. 1.45 means 1 min 45 s and 1.3 means 1 min 30 s.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+
+    if isinstance(value, (int, float)):
+        if value < 0:
+            raise ValueError(f"Negative timestamp: {value!r}")
+        if float_format == "minutes.seconds":
+            minutes = int(value)
+            seconds = round((value - minutes) * 100, 3)
+            if seconds >= 60:
+                raise ValueError(f"Invalid minutes.seconds timestamp: {value!r}")
+            return int(round((minutes * 60 + seconds) * 1000))
+        return int(round(value * 1000))
+
+    match = _CLOCK_RE.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    first, second, seconds = match.groups()
+    # With one colon the leading group is minutes, with two it is hours then minutes
+    hours, minutes = (first, second) if second is not None else (None, first)
+    # A field below a higher one wraps at 60, as the minutes.seconds numbers do
+    if (minutes is not None and float(seconds) >= 60) or (hours is not None and int(minutes) >= 60):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    total = int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+    return int(round(total * 1000))
+
+def format_timestamp(ms):
+    """Format milliseconds as HH:MM:SS, the form the analysis schema uses"""
+    seconds = int(ms // 1000)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def to_frame_index(ms, fps):
+    """Return the index of the frame shown at ms for a constant frame rate"""
+    return int(ms * fps // 1000)
+
+def _bounds(rally):
+    if "start_ms" in rally:
+        return rally["start_ms"], rally["end_ms"]
+    if "start" in rally:
+        return rally["start"], rally["end"]
+    return rally["from"], rally["to"]
+
+def normalize_rallies(rallies, float_format="seconds", merge_gap_ms=0, min_duration_ms=1, strict=False):
+    """Parse, validate, sort and merge rally ranges.
+
+    Each rally may use start/end (numbers or clock strings), from/to (analysis schema) or already
+    normalized start_ms/end_ms. Returns a list of {"start_ms", "end_ms", "start", "end"} dicts, with
+    start/end in seconds for moviepy and ffmpeg. Empty or reversed ranges are dropped (or raise
+    ValueError when strict); overlapping ranges and ranges separated by at most merge_gap_ms are merged.
+    """
+    ranges = []
+    for idx, rally in enumerate(rallies):
+        start, end = _bounds(rally)
+        if "start_ms" not in rally:
+            start, end = parse_timestamp(start, float_format), parse_timestamp(end, float_format)
+        if end - start < min_duration_ms:
+            if strict:
+                raise ValueError(f"Rally {idx + 1} has an invalid range: {start}ms to {end}ms")
+            print(f"Skipping rally {idx + 1}: invalid range {start}ms to {end}ms")
+            continue
+        ranges.append((start, end))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start - merged[-1][1] <= merge_gap_ms:
+            if strict and start < merged[-1][1]:
+                raise ValueError(f"Rallies overlap at {format_timestamp(start)}")
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return [
+        {"start_ms": start, "end_ms": end, "start": start / 1000, "end": end / 1000}
+        for start, end in merged
+    ]
+
+def normalize_timestamps(timestamps, **kwargs):
+    """Normalize a {"rallies": [...]} dict as produced by segmentation; see normalize_rallies"""
+    return {"rallies": normalize_rallies(timestamps["rallies"], **kwargs)}
@@ -0,0 +1,264 @@
+"""
+Process-wide admission control for Gemini generate requests.
+
+Every analysis path reserves its request with default_scheduler before calling the model. Two
+token buckets, one for requests and one for tokens per minute, keep the process under the
+project's quota, so concurrent Streamlit sessions queue here instead of all hitting 429 and
+backing off together. Waiting requests are granted in priority order (interactive before
+batch) and, within a priority, to the tenant (Streamlit session) that has used the least
+of the quota so far, so one large match cannot starve an analyst who started later.
+Processes that call share_quota with the same SQLite file (the analysis workers) draw on one
+quota between them instead of each on its own.
+
+    set_tenant(streamlit_tenant(), INTERACTIVE)
+    ...
+    with default_scheduler.reserve(estimate_tokens([video_file], prompt)) as slot:
+        response = model.generate_content([video_file, prompt])
+        slot.record_usage(response)
+"""
+
+import os
+import time
+import threading
+import itertools
+import contextlib
+import contextvars
+from google.api_core import exceptions as api_exceptions
+from sqlite_store import SQLiteStore
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)   # highest first
+
+# Free-tier gemini-1.5-flash limits; raise them to the project's quota on paid tiers
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_RPM", 15))
+TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TPM", 1_000_000))
+# Share of each per-minute budget that may be spent at once; the rest refills evenly over the
+# minute, so no sliding 60 s window ever sees more than the limit
+BURST_FRACTION = float(os.getenv("GEMINI_BURST_FRACTION", 0.1))
+
+VIDEO_TOKENS_PER_SECOND = 300       # ~258 per frame at 1 fps plus audio
+DEFAULT_VIDEO_SECONDS = 30          # when the file has no duration metadata (about one rally clip)
+RESPONSE_TOKENS = 2000
+
+_current = contextvars.ContextVar("gemini_tenant", default=("default", INTERACTIVE))
+
+QUOTA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_buckets (
+    name TEXT PRIMARY KEY,
+    level REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+class TokenBucket:
+    def __init__(self, per_minute, burst_fraction=BURST_FRACTION, period=60.0):
+        self.capacity = max(1.0, per_minute * burst_fraction)
+        self.rate = per_minute * (1 - burst_fraction) / period
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def fits(self, cost):
+        # A request larger than the whole bucket goes through once the bucket is full
+        return self.level >= min(cost, self.capacity)
+
+    def wait_time(self, cost):
+        return max(0.0, (min(cost, self.capacity) - self.level) / self.rate)
+
+class SharedBuckets(SQLiteStore):
+    """Bucket levels kept in a SQLite file, so every process using the file spends one quota.
+    Bucket times are wall-clock seconds here, as monotonic clocks differ between processes."""
+
+    schema = QUOTA_SCHEMA
+
+    @contextlib.contextmanager
+    def hold(self, buckets):
+        """Load the shared levels into buckets ({name: TokenBucket}) and write them back on exit,
+        with the file locked in between"""
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name, level, updated in conn.execute("SELECT name, level, updated FROM quota_buckets"):
+                    if name in buckets:
+                        buckets[name].level = min(level, buckets[name].capacity)
+                        buckets[name].updated = updated
+                yield
+                conn.executemany("INSERT OR REPLACE INTO quota_buckets VALUES (?, ?, ?)",
+                                 [(name, bucket.level, bucket.updated) for name, bucket in buckets.items()])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+class Reservation:
+    """A granted request; record its usage before the block ends so the token budget is corrected"""
+
+    def __init__(self, scheduler, tenant, priority, tokens, seq):
+        self.scheduler = scheduler
+        self.tenant = tenant
+        self.priority = priority
+        self.tokens = tokens
+        self.seq = seq
+        self.queued_at = time.monotonic()
+        self.waited = 0.0
+        self.used_tokens = None
+
+    def record_usage(self, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.used_tokens = usage.total_token_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, api_exceptions.TooManyRequests):
+            self.scheduler.throttle()
+        self.scheduler.settle(self)
+
+class RequestScheduler:
+    """period is the length of the quota window in seconds; only load tests shorten it"""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 burst_fraction=BURST_FRACTION, period=60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = TokenBucket(requests_per_minute, burst_fraction, period)
+        self._tokens = TokenBucket(tokens_per_minute, burst_fraction, period)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._served = {}           # tenant -> share of a minute's quota used so far
+        self._tenants = {}          # tenant -> {"granted", "waited_seconds"}
+        self._throttled = 0
+        self._seq = itertools.count()
+        self._shared = None
+        self._clock = time.monotonic
+
+    def set_limits(self, requests_per_minute, tokens_per_minute, burst_fraction=BURST_FRACTION, period=60.0):
+        """Replace the quota of a scheduler that is already in use (modules share default_scheduler
+        by name, so load tests change its limits rather than installing another scheduler)"""
+        with self._cond:
+            self.requests_per_minute = requests_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            self._requests = TokenBucket(requests_per_minute, burst_fraction, period)
+            self._tokens = TokenBucket(tokens_per_minute, burst_fraction, period)
+            self._requests.updated = self._tokens.updated = self._clock()
+            self._cond.notify_all()
+
+    def share_quota(self, path):
+        """Keep the quota in the SQLite file at path, shared with every process that does the same.
+        Priority and tenant fairness still apply among the requests waiting in this process."""
+        with self._cond:
+            self._shared = SharedBuckets(path)
+            self._clock = time.time
+            self._requests.updated = self._tokens.updated = self._clock()
+
+    def _buckets(self):
+        """Context in which the buckets hold the current levels (those of the shared file, if any)"""
+        if self._shared is None:
+            return contextlib.nullcontext()
+        return self._shared.hold({"requests": self._requests, "tokens": self._tokens})
+
+    def _cost(self, tokens):
+        return 1 / self.requests_per_minute + tokens / self.tokens_per_minute
+
+    def _next(self):
+        for priority in PRIORITIES:
+            waiting = [r for r in self._waiting if r.priority == priority]
+            if waiting:
+                return min(waiting, key=lambda r: (self._served.get(r.tenant, 0.0), r.seq))
+        return None
+
+    def reserve(self, tokens=RESPONSE_TOKENS, tenant=None, priority=None):
+        """Block until the request may be sent and return its Reservation (a context manager)"""
+        default_tenant, default_priority = _current.get()
+        reservation = Reservation(self, tenant or default_tenant, priority or default_priority, tokens,
+                                  next(self._seq))
+        with self._cond:
+            # A tenant coming back after a pause starts level with the others instead of
+            # cashing in the quota it did not use meanwhile
+            if not any(r.tenant == reservation.tenant for r in self._waiting):
+                active = [self._served.get(r.tenant, 0.0) for r in self._waiting]
+                if active:
+                    self._served[reservation.tenant] = max(self._served.get(reservation.tenant, 0.0), min(active))
+            self._waiting.append(reservation)
+
+            while True:
+                timeout = None
+                if self._next() is reservation:
+                    with self._buckets():
+                        now = self._clock()
+                        self._requests.refill(now)
+                        self._tokens.refill(now)
+                        granted = self._requests.fits(1) and self._tokens.fits(tokens)
+                        if granted:
+                            self._requests.level -= 1
+                            self._tokens.level -= tokens
+                        else:
+                            timeout = max(0.01, self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                    if granted:
+                        break
+                self._cond.wait(timeout)
+
+            self._waiting.remove(reservation)
+            self._served[reservation.tenant] = self._served.get(reservation.tenant, 0.0) + self._cost(tokens)
+            reservation.waited = time.monotonic() - reservation.queued_at
+            stats = self._tenants.setdefault(reservation.tenant, {"granted": 0, "waited_seconds": 0.0})
+            stats["granted"] += 1
+            stats["waited_seconds"] += reservation.waited
+            # The next request in line may already fit
+            self._cond.notify_all()
+        return reservation
+
+    def settle(self, reservation):
+        """Replace a reservation's estimate with the tokens the response actually used"""
+        if reservation.used_tokens is None:
+            return
+        with self._cond, self._buckets():
+            difference = reservation.used_tokens - reservation.tokens
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level - difference)
+            self._served[reservation.tenant] = self._served.get(reservation.tenant, 0.0) + difference / self.tokens_per_minute
+            self._cond.notify_all()
+
+    def throttle(self):
+        """The API answered 429 anyway: empty both buckets so nothing else is sent until they refill"""
+        with self._cond, self._buckets():
+            self._requests.level = min(self._requests.level, 0.0)
+            self._tokens.level = min(self._tokens.level, 0.0)
+            self._throttled += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "waiting": len(self._waiting),
+                "throttled": self._throttled,
+                "tenants": {tenant: dict(stats) for tenant, stats in self._tenants.items()},
+            }
+
+def set_tenant(tenant, priority=INTERACTIVE):
+    """Count the requests this thread reserves from now on (and those of the analyze_concurrently
+    workers it starts) as tenant's, at the given priority"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r}, expected one of {PRIORITIES}")
+    _current.set((tenant, priority))
+
+def estimate_tokens(files, *texts):
+    """Rough prompt + response size of a request over uploaded Gemini video files and text parts"""
+    seconds = 0.0
+    for file in files:
+        duration = getattr(getattr(file, "video_metadata", None), "video_duration", None)
+        duration = duration.total_seconds() if hasattr(duration, "total_seconds") else 0.0
+        seconds += duration or DEFAULT_VIDEO_SECONDS
+    return int(seconds * VIDEO_TOKENS_PER_SECOND) + sum(len(text) for text in texts) // 4 + RESPONSE_TOKENS
+
+def streamlit_tenant():
+    """The current Streamlit session's id, or "default" outside a Streamlit script run"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else "default"
+
+default_scheduler = RequestScheduler()
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import threading
+from atomic_file import atomic_write_json
+
+CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", ".analysis_cache")
+CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+def file_digest(path, chunk_size=HASH_CHUNK_SIZE):
+    """Return the SHA-256 hex digest of a file, read in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _to_jsonable(value):
+    """json.dumps fallback for the protobuf schemas used in generation configs"""
+    return type(value).to_dict(value)
+
+def config_fingerprint(generation_config):
+    """Serialize a generation config (plain dicts or content.Schema protos) deterministically"""
+    return json.dumps(generation_config, sort_keys=True, default=_to_jsonable)
+
+def make_key(video_digest, model_name, system_instruction, prompt, generation_config):
+    """Build the cache key for one analysis request.
+
+    generation_config may also be a fingerprint that was already computed with config_fingerprint.
+    """
+    if not isinstance(generation_config, str):
+        generation_config = config_fingerprint(generation_config)
+    digest = hashlib.sha256()
+    for part in (video_digest, model_name, system_instruction, prompt, generation_config):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class ResultCache:
+    """On-disk cache of parsed analysis results with size-bounded LRU eviction.
+
+    Each entry is one JSON file named after its key; its mtime is bumped on every hit
+    and serves as the LRU clock, so the cache is shared safely between processes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached result for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store a result atomically, then evict least recently used entries over the size bound"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        atomic_write_json(self._path(key), value)
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+                total -= size
+
+    def stats(self):
+        """Return the hit/miss counters of this process"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+default_cache = ResultCache()
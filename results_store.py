@@ -0,0 +1,176 @@
+"""
+Persistent store of analysed matches in a local SQLite database.
+
+Every match keeps its combined results (so it can be shown again without calling Gemini) and
+is also broken down into normalized rows (match, rally, player, metric, value, timestamp), indexed
+by player and match for queries across many matches.
+
+$ python results_store.py --player "Lin Dan" --metric smash
+"""
+
+import os
+import json
+import time
+import argparse
+from contextlib import closing
+from rally_timestamps import parse_timestamp
+from sqlite_store import SQLiteStore
+
+STORE_PATH = os.getenv("ANALYSIS_DB_PATH", "analysis_results.db")
+PLAYERS = ("Player1", "Player2")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    match_id TEXT PRIMARY KEY,
+    video_name TEXT,
+    player1 TEXT,
+    player2 TEXT,
+    rally_count INTEGER,
+    analysed_at REAL,
+    results TEXT
+);
+CREATE TABLE IF NOT EXISTS rallies (
+    match_id TEXT NOT NULL REFERENCES matches(match_id) ON DELETE CASCADE,
+    rally_index INTEGER NOT NULL,
+    segment_id INTEGER,
+    start_s REAL,
+    end_s REAL,
+    shots INTEGER,
+    PRIMARY KEY (match_id, rally_index)
+);
+CREATE TABLE IF NOT EXISTS events (
+    match_id TEXT NOT NULL REFERENCES matches(match_id) ON DELETE CASCADE,
+    rally_index INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    timestamp_s REAL,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS events_player ON events (player, metric);
+CREATE INDEX IF NOT EXISTS events_metric ON events (metric, player, value);
+CREATE INDEX IF NOT EXISTS events_match ON events (match_id, rally_index);
+CREATE INDEX IF NOT EXISTS matches_players ON matches (player1, player2);
+"""
+
+# (section in the rally JSON, metric name for each timestamped item, metric name for the count)
+TIMESTAMPED_SECTIONS = (
+    ("Smashes", "smash", "smashes"),
+    ("Fouls", "foul", "fouls"),
+    ("Court Reach", "court_reach", None),
+    ("Footwork", "footwork", None),
+)
+
+def _seconds(value, offset):
+    try:
+        return offset + parse_timestamp(value) / 1000
+    except (TypeError, ValueError):
+        return None
+
+def match_rows(match_id, combined_results):
+    """Yield ("rallies" | "events", row) tuples for every rally of a match's combined results"""
+    rally_index = 0
+    for segment in combined_results.get('individual_rallies', []):
+        match = segment.get('match') or {}
+        names = {slot: match.get(slot, slot) for slot in PLAYERS}
+        offset = (segment.get('timestamp') or {}).get('start', 0.0)
+        for rally in match.get('Rallies', []):
+            yield "rallies", (match_id, rally_index, segment.get('segment_id'), _seconds(rally.get('from'), offset),
+                              _seconds(rally.get('to'), offset), rally.get('rally_shots_count'))
+
+            for slot in PLAYERS:
+                stamina = (rally.get('Stamina') or {}).get(slot) or {}
+                if 'percentage' in stamina:
+                    yield "events", (match_id, rally_index, names[slot], slot, "stamina", stamina['percentage'],
+                                     None, stamina.get('Description'))
+
+                for section, item_metric, count_metric in TIMESTAMPED_SECTIONS:
+                    entry = (rally.get(section) or {}).get(slot) or {}
+                    if count_metric and 'count' in entry:
+                        yield "events", (match_id, rally_index, names[slot], slot, count_metric, entry['count'], None, None)
+                    descriptions = entry.get('Description') or []
+                    for i, timestamp in enumerate(entry.get('Timestamp') or []):
+                        description = descriptions[i] if i < len(descriptions) else None
+                        yield "events", (match_id, rally_index, names[slot], slot, item_metric, 1,
+                                         _seconds(timestamp, offset), description)
+            rally_index += 1
+
+class ResultsStore(SQLiteStore):
+    """SQLite-backed store of analysed matches"""
+
+    schema = SCHEMA
+    foreign_keys = True
+
+    def __init__(self, path=STORE_PATH):
+        super().__init__(path)
+
+    def save_match(self, match_id, combined_results, video_name=None):
+        """Store (or replace) a match's combined results and its normalized rally and event rows"""
+        first = next((r['match'] for r in combined_results.get('individual_rallies', []) if r.get('match')), {})
+        rows = {"rallies": [], "events": []}
+        for table, row in match_rows(match_id, combined_results):
+            rows[table].append(row)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM matches WHERE match_id = ?", (match_id,))
+            conn.execute(
+                "INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (match_id, video_name, first.get('Player1'), first.get('Player2'), len(rows["rallies"]),
+                 time.time(), json.dumps(combined_results)),
+            )
+            conn.executemany("INSERT INTO rallies VALUES (?, ?, ?, ?, ?, ?)", rows["rallies"])
+            conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows["events"])
+
+    def load_match(self, match_id):
+        """Return the combined results stored for a match, or None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT results FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+        return json.loads(row['results']) if row else None
+
+    def list_matches(self):
+        """Return the stored matches, most recently analysed first"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT match_id, video_name, player1, player2, rally_count, analysed_at FROM matches "
+                "ORDER BY analysed_at DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def events(self, player=None, metric=None, match_id=None):
+        """Return event rows filtered by any of player name, metric and match, in match timeline order"""
+        clauses, params = [], []
+        for column, value in (("player", player), ("metric", metric), ("match_id", match_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT * FROM events {where} ORDER BY match_id, rally_index, timestamp_s", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def player_totals(self, metric):
+        """Return {player: total value} of a metric across every stored match"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT player, SUM(value) AS total FROM events WHERE metric = ? GROUP BY player ORDER BY total DESC",
+                (metric,),
+            ).fetchall()
+        return {row['player']: row['total'] for row in rows}
+
+default_store = ResultsStore()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--player")
+    parser.add_argument("--metric")
+    parser.add_argument("--match")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    events = default_store.events(player=args.player, metric=args.metric, match_id=args.match)
+    for event in events:
+        print(json.dumps(event))
+    print(f"{len(events)} events in {(time.perf_counter() - started) * 1000:.1f} ms")
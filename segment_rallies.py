@@ -1,53 +1,369 @@
 from moviepy.editor import VideoFileClip
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 import os
+import re
+import sys
 import json
+import time
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from rally_timestamps import normalize_rallies
+from result_cache import file_digest
+from atomic_file import atomic_write_json
 
-def split_video(video_path, timestamps, output_folder="video_segments"):
+# "reencode" decodes and re-encodes every rally with moviepy (frame accurate, slowest).
+# "copy" stream-copies the rally, snapping the start back to the previous keyframe.
+# "smart" re-encodes only the partial GOPs at each boundary and stream-copies the rest.
+# "single_pass" decodes the match once and fans frames out to one encoder per open rally.
+CUT_MODES = ("reencode", "copy", "smart", "single_pass")
+
+SEGMENT_FOLDER = "video_segments"
+MANIFEST_NAME = "manifest.json"
+
+def run_ffmpeg(args):
+    """Run the ffmpeg binary bundled with moviepy and raise on failure"""
+    cmd = [get_setting("FFMPEG_BINARY"), "-hide_banner", "-loglevel", "error", "-y"] + args
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+def list_keyframes(video_path):
+    """Return the presentation times (in seconds) of every keyframe of the first video stream"""
+    # ffprobe is not shipped with imageio-ffmpeg, so decode only the keyframes and read showinfo
+    cmd = [
+        get_setting("FFMPEG_BINARY"), "-hide_banner", "-nostats",
+        "-skip_frame", "nokey", "-i", video_path,
+        "-map", "0:v:0", "-vf", "showinfo", "-f", "null", "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    return sorted(float(t) for t in re.findall(r"pts_time:\s*(-?[0-9.]+)", proc.stderr))
+
+def copy_range(video_path, start_time, end_time, output_path):
+    """Stream-copy a time range; the cut starts at the keyframe at or before start_time"""
+    run_ffmpeg([
+        "-ss", f"{start_time:.3f}", "-i", video_path,
+        "-t", f"{end_time - start_time:.3f}",
+        "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+        "-avoid_negative_ts", "make_zero",
+        output_path,
+    ])
+
+def encode_range(video_path, start_time, end_time, output_path):
+    """Frame-accurately re-encode a time range with libx264/aac"""
+    run_ffmpeg([
+        "-ss", f"{start_time:.3f}", "-i", video_path,
+        "-t", f"{end_time - start_time:.3f}",
+        "-map", "0:v:0", "-map", "0:a?",
+        "-c:v", "libx264", "-c:a", "aac",
+        output_path,
+    ])
+
+def probe_video(video_path):
+    """Codec, profile, pixel format, frame rate and timescale of the first video stream, read from
+    ffmpeg's stream banner (there is no ffprobe)"""
+    proc = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-i", video_path],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    match = re.search(r"Stream #0:\d+.*?: Video: (\w+)(?: \(([^)]*)\))?.*", proc.stderr)
+    if match is None:
+        raise ValueError(f"No video stream in {video_path}")
+    line = match.group(0)
+    pix_fmt = re.search(r", (yuv\w+|nv12|gray\w*)[,(]", line)
+    fps = re.search(r"([0-9.]+) fps", line)
+    timescale = re.search(r"([0-9.]+)(k?) tbn", line)
+    return {
+        "codec": match.group(1),
+        "profile": (match.group(2) or "").lower(),
+        "pix_fmt": pix_fmt.group(1) if pix_fmt else None,
+        "fps": float(fps.group(1)) if fps else None,
+        "timescale": int(float(timescale.group(1)) * (1000 if timescale.group(2) else 1)) if timescale else None,
+    }
+
+def count_frames(video_path):
+    """Decode the first video stream and return (frames decoded, decoder errors)"""
+    proc = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-v", "error", "-stats",
+                           "-i", video_path, "-map", "0:v:0", "-f", "null", "-"],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    lines = [line.strip() for line in re.split(r"[\r\n]+", proc.stderr) if line.strip()]
+    frames = [int(m.group(1)) for m in (re.match(r"frame=\s*(\d+)", line) for line in lines) if m]
+    errors = [line for line in lines if not line.startswith("frame=")]
+    return (frames[-1] if frames else 0), errors
+
+def smart_cut(video_path, start_time, end_time, output_path, keyframes):
+    """Cut a rally by re-encoding the boundary GOPs and stream-copying the GOPs in between.
+
+    Only H.264 sources are spliced: the boundary pieces are encoded with the source's profile,
+    pixel format and timescale and carry their parameter sets in-band, so the copied GOPs still
+    decode after the join. Other codecs, and any splice that does not decode to the expected
+    number of frames, are re-encoded whole with encode_range. The boundary pieces have no
+    B-frames, so decode timestamps stay monotonic across each join.
+    """
+    inner = [k for k in keyframes if start_time <= k <= end_time]
+    info = probe_video(video_path)
+    if len(inner) < 2 or info["codec"] != "h264" or not info["fps"]:
+        # Nothing to copy, or a codec libx264 pieces cannot be spliced into
+        encode_range(video_path, start_time, end_time, output_path)
+        return
+
+    first_key, last_key = inner[0], inner[-1]
+    # Input seeking with -c copy snaps back to the keyframe at or before -ss; half a frame past
+    # the keyframe keeps rounding from pulling in the previous GOP
+    nudge = 0.5 / info["fps"]
+    timescale = ["-video_track_timescale", str(info["timescale"])] if info["timescale"] else []
+    encode_args = ["-c:v", "libx264", "-pix_fmt", info["pix_fmt"] or "yuv420p", "-bf", "0"] + timescale
+    if info["profile"] in ("baseline", "constrained baseline", "main", "high"):
+        encode_args += ["-profile:v", "baseline" if "baseline" in info["profile"] else info["profile"]]
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="smartcut-") as work_dir:
+            parts = []
+
+            def add_part(name, start, duration, codec_args):
+                parts.append(os.path.join(work_dir, f"{name}.mp4"))
+                run_ffmpeg(["-ss", f"{start:.6f}", "-i", video_path, "-t", f"{duration:.6f}", "-map", "0:v:0", "-an"]
+                           + codec_args + ["-avoid_negative_ts", "make_zero", parts[-1]])
+
+            if first_key > start_time:
+                add_part("head", start_time, first_key - start_time, encode_args)
+            # A stream copy stops on decode timestamps, which lag behind presentation with B-frames, so
+            # the next keyframe would slip in; drop every packet shown at or after last_key instead
+            body_end = (last_key - nudge) - (first_key + nudge)
+            add_part("body", first_key + nudge, last_key - first_key + 1.0,
+                     ["-c:v", "copy", "-bsf:v", f"noise=drop=gte(pts*tb\\,{body_end:.6f})"])
+            if end_time > last_key:
+                add_part("tail", last_key, end_time - last_key, encode_args)
+
+            # The concat demuxer passes each piece's parameter sets along in-band, so the copied GOPs
+            # keep decoding with the source's SPS/PPS; the audio is re-encoded over the whole range
+            list_path = os.path.join(work_dir, "parts.txt")
+            with open(list_path, 'w') as f:
+                for part in parts:
+                    f.write(f"file '{part}'\n")
+            joined = os.path.join(work_dir, "video.mp4")
+            run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", joined])
+            run_ffmpeg([
+                "-i", joined, "-ss", f"{start_time:.6f}", "-i", video_path, "-t", f"{end_time - start_time:.6f}",
+                "-map", "0:v:0", "-map", "1:a?", "-c:v", "copy", "-c:a", "aac",
+                output_path,
+            ])
+    except subprocess.CalledProcessError as e:
+        print(f"Smart cut of {start_time:.2f}s to {end_time:.2f}s failed ({e.stderr.decode(errors='replace').strip()}); "
+              "re-encoding it")
+        encode_range(video_path, start_time, end_time, output_path)
+        return
+
+    expected = (end_time - start_time) * info["fps"]
+    frames, errors = count_frames(output_path)
+    if errors or abs(frames - expected) > 1:
+        print(f"Smart cut of {start_time:.2f}s to {end_time:.2f}s gave {frames} frames "
+              f"({expected:.0f} expected{', decode errors' if errors else ''}); re-encoding it")
+        encode_range(video_path, start_time, end_time, output_path)
+
+_worker_clip = None
+
+def _open_worker_clip(video_path):
+    """Process pool initializer: each worker decodes the source through its own reader"""
+    global _worker_clip
+    _worker_clip = VideoFileClip(video_path)
+
+def export_segment(video_path, index, start_time, end_time, output_folder, mode, keyframes=None, video=None, threads=None):
+    """Write one rally to segment_{index:03d}.mp4 and return its path and export time"""
+    output_path = os.path.join(output_folder, f"segment_{index:03d}.mp4")
+    started = time.perf_counter()
+
+    if mode == "copy":
+        copy_range(video_path, start_time, end_time, output_path)
+    elif mode == "smart":
+        smart_cut(video_path, start_time, end_time, output_path, keyframes)
+    else:
+        segment = (video or _worker_clip).subclip(start_time, end_time)
+        # A private temp dir per segment so concurrent exports never share an audio file
+        with tempfile.TemporaryDirectory(prefix=f"segment_{index:03d}-") as work_dir:
+            segment.write_videofile(
+                output_path,
+                codec='libx264',
+                audio_codec='aac',
+                temp_audiofile=os.path.join(work_dir, 'temp-audio.m4a'),
+                remove_temp=True,
+                threads=threads,
+                logger='bar' if threads is None else None
+            )
+
+    elapsed = time.perf_counter() - started
+    print(f"Saved segment {index}: {start_time:.2f}s to {end_time:.2f}s in {elapsed:.2f}s")
+    return {"index": index, "path": output_path, "seconds": elapsed}
+
+def copy_audio_range(video_path, start_time, end_time, output_path):
+    """Stream-copy just the audio track of a time range"""
+    run_ffmpeg([
+        "-ss", f"{start_time:.3f}", "-i", video_path,
+        "-t", f"{end_time - start_time:.3f}",
+        "-vn", "-c:a", "copy",
+        output_path,
+    ])
+
+def single_pass_split(video_path, rallies, output_folder):
+    """Decode the match once, front to back, and feed each frame to every rally window it falls in.
+
+    rallies is a list of (index, rally) pairs. Frames are only decoded inside rally windows (the
+    reader seeks across long gaps) and each frame is decoded exactly once, even where windows
+    overlap. Only the current frame is held in memory; each open window owns one encoder pipe.
+    Audio is stream-copied per rally beforehand and muxed by the encoder.
+    """
+    video = VideoFileClip(video_path)
+    fps = video.fps
+    last_frame = int(video.duration * fps)
+
+    windows = deque(sorted(
+        (int(round(rally["start"] * fps)), min(last_frame, int(round(rally["end"] * fps))), i, rally)
+        for i, rally in rallies
+    ))
+    records = {}
+    active = []
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="single-pass-") as work_dir:
+            frame_index = 0
+            while windows or active:
+                if not active:
+                    # Nothing is recording: jump straight to the next rally
+                    frame_index = max(frame_index, windows[0][0])
+
+                while windows and windows[0][0] <= frame_index:
+                    start_frame, end_frame, i, rally = windows.popleft()
+                    audio_path = None
+                    if video.audio is not None:
+                        audio_path = os.path.join(work_dir, f"segment_{i:03d}.m4a")
+                        copy_audio_range(video_path, rally["start"], rally["end"], audio_path)
+                    output_path = os.path.join(output_folder, f"segment_{i:03d}.mp4")
+                    writer = FFMPEG_VideoWriter(output_path, video.size, fps, codec='libx264', audiofile=audio_path)
+                    active.append((end_frame, i, rally, output_path, writer, time.perf_counter()))
+
+                if frame_index < last_frame:
+                    frame = video.get_frame(frame_index / fps)
+                    for _, _, _, _, writer, _ in active:
+                        writer.write_frame(frame)
+                frame_index += 1
+
+                still_open = []
+                for entry in active:
+                    end_frame, i, rally, output_path, writer, opened = entry
+                    if frame_index >= end_frame or frame_index >= last_frame:
+                        writer.close()
+                        elapsed = time.perf_counter() - opened
+                        print(f"Saved segment {i}: {rally['start']:.2f}s to {rally['end']:.2f}s in {elapsed:.2f}s")
+                        records[i] = {"index": i, "path": output_path, "seconds": elapsed}
+                    else:
+                        still_open.append(entry)
+                active = still_open
+    finally:
+        for _, _, _, _, writer, _ in active:
+            writer.close()
+        video.close()
+
+    return [records[i] for i in sorted(records)]
+
+def match_folder(output_folder, match_id):
+    """The directory a match's segments are cut into, so no two matches ever share one"""
+    return os.path.join(output_folder, match_id[:16])
+
+def describe_segment(record, rally, mode):
+    """Complete an export record into a manifest entry: time range, cut mode, size, duration and content hash"""
+    path = record["path"]
+    return {
+        "index": record["index"],
+        "start": rally["start"],
+        "end": rally["end"],
+        "mode": mode,
+        "path": path,
+        "size_bytes": os.path.getsize(path),
+        "duration": ffmpeg_parse_infos(path)["duration"],
+        "sha256": file_digest(path),
+        "seconds": record["seconds"],
+    }
+
+def load_manifest(folder, timestamps, mode=None):
+    """Return the manifest of a previous split of the same rallies into folder if every segment is
+    still there unchanged in size (and, when mode is given, was cut in that mode), otherwise None"""
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    rallies = normalize_rallies(timestamps["rallies"])
+    if len(manifest) != len(rallies):
+        return None
+    for entry, rally in zip(manifest, rallies):
+        if (entry["start"], entry["end"]) != (rally["start"], rally["end"]):
+            return None
+        if mode is not None and entry.get("mode") != mode:
+            return None
+        if not os.path.exists(entry["path"]) or os.path.getsize(entry["path"]) != entry["size_bytes"]:
+            return None
+    return manifest
+
+def split_video(video_path, timestamps, output_folder=SEGMENT_FOLDER, mode="reencode", workers=1, match_id=None):
+    """Cut every rally into its own file and return the segment manifest, in rally order.
+
+    Segments go to a directory of their own under output_folder, named after match_id (the
+    video's content hash when not given). Each manifest entry has the 1-based segment index,
+    the rally's start and end in match seconds, the cut mode, the segment's path, size_bytes,
+    duration and sha256, and the export time; the manifest is also saved next to the segments,
+    for load_manifest. Consumers use it as is and never list the directory.
+
+    workers > 1 spreads the rallies over a process pool; None uses one worker per CPU.
+    The single_pass mode always runs in-process, since its point is one sequential decode.
+    """
+    if mode not in CUT_MODES:
+        raise ValueError(f"Unknown cut mode '{mode}', expected one of {CUT_MODES}")
+
+    output_folder = match_folder(output_folder, match_id or file_digest(video_path))
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    
-    video = VideoFileClip(video_path)
-    
-    for i, rally in enumerate(timestamps["rallies"], 1):
-        start_time = rally["start"]
-        end_time = rally["end"]
-        
-        segment = video.subclip(start_time, end_time)
-        
-        output_path = os.path.join(output_folder, f"segment_{i:03d}.mp4")
-        
-        segment.write_videofile(
-            output_path,
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True
-        )
-        
-        print(f"Saved segment {i}: {start_time:.2f}s to {end_time:.2f}s")
-    
-    video.close()
+
+    # Parse and validate once here, so no worker is handed a reversed or empty range
+    rallies = list(enumerate(normalize_rallies(timestamps["rallies"]), 1))
+    keyframes = list_keyframes(video_path) if mode == "smart" else None
+    workers = min(workers or os.cpu_count() or 1, max(len(rallies), 1))
+    started = time.perf_counter()
+
+    if mode == "single_pass":
+        workers = 1
+        records = single_pass_split(video_path, rallies, output_folder)
+    elif workers == 1:
+        video = VideoFileClip(video_path) if mode == "reencode" else None
+        try:
+            records = [
+                export_segment(video_path, i, rally["start"], rally["end"], output_folder, mode, keyframes, video)
+                for i, rally in rallies
+            ]
+        finally:
+            if video is not None:
+                video.close()
+    else:
+        initializer = _open_worker_clip if mode == "reencode" else None
+        initargs = (video_path,) if mode == "reencode" else ()
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+            # One encoder thread per worker, otherwise every x264 instance grabs all the cores
+            futures = [
+                pool.submit(export_segment, video_path, i, rally["start"], rally["end"],
+                            output_folder, mode, keyframes, None, 1)
+                for i, rally in rallies
+            ]
+            records = [future.result() for future in futures]
+
+    print(f"Exported {len(records)} segments with {workers} worker(s) in {time.perf_counter() - started:.2f}s")
+    manifest = [describe_segment(record, rally, mode) for record, (_, rally) in zip(records, rallies)]
+    # Written last and atomically, so a manifest on disk always describes finished segments
+    atomic_write_json(os.path.join(output_folder, MANIFEST_NAME), manifest, indent=2)
+    return manifest
 
 if __name__ == "__main__":
-    timestamps = {
-  "rallies": [
-    { "start": 0.05, "end": 0.2 },
-    { "start": 0.24, "end": 0.39 },
-    { "start": 0.41, "end": 0.47 },
-    { "start": 0.49, "end": 0.77 },
-    { "start": 0.79, "end": 1.13 },
-    { "start": 1.17, "end": 1.21 },
-    { "start": 1.24, "end": 1.3 },
-    { "start": 1.32, "end": 1.43 },
-    { "start": 1.45, "end": 2.01 },
-    { "start": 2.03, "end": 2.18 },
-    { "start": 2.19, "end": 2.23 },
-    { "start": 2.26, "end": 2.31 },
-    { "start": 2.33, "end": 2.37 },
-    { "start": 2.38, "end": 2.51 }
-  ]
-}
-    
-    video_path = "/home/auriga/Downloads/videoplayback.mp4"
-    
-    split_video(video_path, timestamps)
\ No newline at end of file
+    # Rally boundaries come from the local detector; pass the match path as the first argument
+    from rally_detector import detect_rallies
+
+    video_path = sys.argv[1] if len(sys.argv) > 1 else "/home/auriga/Downloads/videoplayback.mp4"
+    timestamps = detect_rallies(video_path)
+
+    split_video(video_path, timestamps)
@@ -1,24 +1,38 @@
 import os
-import time
 import json
-import google.generativeai as genai
+import shutil
+from functools import partial
 from google.ai.generativelanguage_v1beta.types import content
-from dotenv import load_dotenv
+import gemini_client
 import streamlit as st
-from segment_rallies import split_video
-from glob import glob
+from concurrent_analysis import analyze_concurrently
+from result_cache import default_cache, file_digest, make_key, config_fingerprint
+from upload_registry import default_registry
+from file_waiter import wait_for_file_active, wait_for_files_active, FileProcessingError
+from media_storage import save_stream_by_digest
+from analysis_proxy import PROXY_PRESETS, make_proxy, remap_analysis_timestamps
+from model_registry import default_models
+from batch_analysis import plan_batches, make_batch_config, batch_parts, split_batch_result
+from results_store import default_store
+from job_journal import default_journal
+from json_stream import ArrayItemStream
+from long_video import (WINDOW_SECONDS, OVERLAP_SECONDS, video_duration, plan_windows,
+                        window_prompt, window_digest, cut_windows, stitch_windows)
+from call_metrics import default_recorder, render_summary
+from request_scheduler import default_scheduler, estimate_tokens
+from analysis_queue import default_queue
 
 
 # Initialize constants
 MEDIA_FOLDER = 'medias'
+JOB_POLL_SECONDS = 2
 
 def init_app():
     """Initialize the application settings and configurations"""
     if not os.path.exists(MEDIA_FOLDER):
         os.makedirs(MEDIA_FOLDER)
     
-    load_dotenv()
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    gemini_client.configure()
     
     # Initialize session state for storing analysis results
     if 'analysis_results' not in st.session_state:
@@ -174,19 +188,15 @@ def get_generation_config():
 }
 
 def save_uploaded_file(uploaded_file):
-    """Save the uploaded file to the media folder and return the file path"""
-    file_path = os.path.join(MEDIA_FOLDER, uploaded_file.name)
-    with open(file_path, 'wb') as f:
-        f.write(uploaded_file.getbuffer())
-    return file_path
-
-def analyze_video(file_path):
-    """Process the video using Gemini API and return analysis results"""
-    with st.spinner("Initializing Gemini model..."):
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=get_generation_config(),
-            system_instruction="""As a badminton analysis expert, evaluate each rally in the provided match video based on official badminton rules.
+    """Write the (in-memory) uploaded file to the media folder and return its path and content hash.
+    The file is named after the hash, so a queued job's video is never replaced by another upload."""
+    return save_stream_by_digest(uploaded_file, MEDIA_FOLDER, os.path.splitext(uploaded_file.name)[1].lower())
+
+MODEL_NAME = "gemini-1.5-flash"
+CONFIG_NAME = "segment_video.analysis"
+BATCH_CONFIG_NAME = "segment_video.batch_analysis"
+
+SYSTEM_INSTRUCTION = """As a badminton analysis expert, evaluate each rally in the provided match video based on official badminton rules.
                                 Begin a new rally when the shuttlecock touches the floor or if there is a noticeable pause between points. 
                                 For each rally, assess the following:
                                 Court Reach: Determine how effectively each player covers the court, noting any areas of strength or weakness.
@@ -195,46 +205,304 @@ def analyze_video(file_path):
                                 Smashes: Identify and timestamp any smashes, along with their effectiveness and player position.
                                 Provide timestamps for specific actions within each rally and track the score incrementally for both players across rallies. 
                                 Format the output according to the provided JSON schema, capturing every element accurately."""
-        )
-
-    with st.spinner("Uploading video to Gemini..."):
-        video_file = genai.upload_file(file_path, mime_type="video/mp4")
-        
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    # Wait for file processing
-    while video_file.state.name == "PROCESSING":
-        status_text.text("Processing video... Please wait.")
-        time.sleep(10)
-        video_file = genai.get_file(video_file.name)
-        progress_bar.progress(0.5)
-
-    if video_file.state.name == "FAILED":
-        st.error("Video processing failed. Please try again.")
-        return None
-
-    with st.spinner("Analyzing video..."):
-        chat_session = model.start_chat(
-            history=[
-                {
-                    "role": "user",
-                    "parts": [video_file],
-                }
-            ]
-        )
 
-        response = chat_session.send_message(
-            """Analyze the provided badminton video and output detailed observations and description for each rally.
+ANALYSIS_PROMPT = """Analyze the provided badminton video and output detailed observations and description for each rally.
             A new rally starts each time a player scores a point. Include analysis of each player's court reach, footwork,
             stamina, fouls, smashes, and provide timestamps. Count the shots per rally and dynamically count all rallies within
             the match. Use the provided JSON schema."""
+
+BATCH_PROMPT = """Each of the provided badminton clips is one rally and is preceded by a label "Segment <id>".
+            Analyze every clip independently and output detailed observations and description for it, including each
+            player's court reach, footwork, stamina, fouls, smashes and timestamps relative to the start of that clip.
+            Return exactly one entry per clip in "segments", with segment_id set to the id from its label. Use the provided JSON schema."""
+
+def get_batch_generation_config():
+    """Return the generation configuration for analysing several rally clips in one request"""
+    return make_batch_config(get_generation_config())
+
+def analysis_cache_key(video_digest, proxy=None, prompt=ANALYSIS_PROMPT):
+    """Result cache key of run_analysis for a video's content hash, proxy settings and prompt"""
+    schema_fingerprint = default_models.fingerprint(CONFIG_NAME, get_generation_config)
+    request_digest = video_digest if proxy is None else f"{video_digest}:{config_fingerprint(proxy)}"
+    return make_key(request_digest, MODEL_NAME, SYSTEM_INSTRUCTION, prompt, schema_fingerprint)
+
+def run_analysis(file_path, on_status=None, video_digest=None, proxy=None, match_id=None, on_uploaded=None,
+                 on_rally=None, prompt=ANALYSIS_PROMPT):
+    """Upload the video, wait for processing and return the parsed analysis, or None if processing failed.
+
+    Makes no Streamlit calls, so it is safe to run from worker threads; on_status(message, fraction)
+    is an optional progress callback. Results are served from the on-disk result cache when the same
+    video was already analysed with the same model, instruction, prompt and schema. proxy is an
+    optional dict of make_proxy settings (see PROXY_PRESETS); when given, a downscaled copy is
+    uploaded instead of the original and timestamps are mapped back to the original.
+    Tokens and per-phase timings are recorded under match_id in call_metrics.default_recorder.
+    on_uploaded(file) is called with the Gemini file once the upload is done. When on_rally is given
+    the response is streamed and on_rally(idx, rally) is called for each element of match.Rallies
+    as soon as it is complete, long before the whole analysis has arrived.
+    """
+    report = on_status or (lambda message, fraction: None)
+    video_digest = video_digest or file_digest(file_path)
+
+    with default_recorder.track(os.path.basename(file_path), match_id) as call:
+        cache_key = analysis_cache_key(video_digest, proxy, prompt)
+        cached = default_cache.get(cache_key)
+        if cached is not None:
+            call.cached = True
+            report("Loaded cached analysis", 1.0)
+            return cached
+
+        model = default_models.model(MODEL_NAME, CONFIG_NAME, get_generation_config, SYSTEM_INSTRUCTION)
+
+        upload_path, upload_digest, proxy_info = file_path, video_digest, None
+        if proxy is not None:
+            report("Building analysis proxy...", 0.0)
+            with call.phase("proxy"):
+                proxy_info = make_proxy(file_path, digest=video_digest, **proxy)
+            upload_path, upload_digest = proxy_info["path"], None
+
+        report("Uploading video to Gemini...", 0.0)
+        with call.phase("upload"):
+            video_file = default_registry.get_or_upload(upload_path, mime_type="video/mp4", digest=upload_digest)
+        if on_uploaded is not None:
+            on_uploaded(video_file)
+
+        # Wait for file processing
+        try:
+            with call.phase("processing_wait"):
+                video_file = wait_for_file_active(
+                    video_file,
+                    on_poll=lambda pending, elapsed: report("Processing video... Please wait.", 0.5)
+                )
+        except FileProcessingError as e:
+            call.error = str(e)
+            return None
+
+        report("Waiting for a Gemini request slot...", 0.7)
+        with call.phase("queue"):
+            slot = default_scheduler.reserve(estimate_tokens([video_file], prompt))
+        report("Analyzing video...", 0.75)
+        with call.phase("generate"), slot:
+            chat_session = model.start_chat(
+                history=[
+                    {
+                        "role": "user",
+                        "parts": [video_file],
+                    }
+                ]
+            )
+            if on_rally is None:
+                response = chat_session.send_message(prompt)
+                response_text = response.text
+            else:
+                response = chat_session.send_message(prompt, stream=True)
+                rallies = ArrayItemStream(("match", "Rallies"))
+                for chunk in response:
+                    completed = rallies.feed(chunk.text)
+                    for offset, rally in enumerate(completed):
+                        if proxy_info is not None:
+                            rally = remap_analysis_timestamps(rally, proxy_info)
+                        on_rally(rallies.count - len(completed) + offset, rally)
+                response_text = rallies.text
+            slot.record_usage(response)
+        call.record_usage(response)
+
+        with call.phase("parse"):
+            results = json.loads(response_text)
+            if proxy_info is not None:
+                results = remap_analysis_timestamps(results, proxy_info)
+        default_cache.put(cache_key, results)
+
+    report("Analysis complete!", 1.0)
+    return results
+
+def run_batch_analysis(clips, on_status=None, proxy=None, match_id=None, digests=None):
+    """Analyse several rally clips with a single Gemini request.
+
+    clips is a list of (segment_id, file_path) pairs; returns {segment_id: result or None}. digests
+    optionally maps segment ids to the clips' known content hashes, so they are not read again.
+    Clips with a cached batch result are not uploaded again, and clips the model left out of its
+    response are retried one at a time through run_analysis. Like run_analysis this makes no
+    Streamlit calls.
+    """
+    digests = dict(digests or {})
+    report = on_status or (lambda message, fraction: None)
+    schema_fingerprint = default_models.fingerprint(BATCH_CONFIG_NAME, get_batch_generation_config)
+    label = "batch " + ",".join(str(segment_id) for segment_id, _ in clips)
+
+    results, pending = {}, []
+    for segment_id, file_path in clips:
+        clip_digest = digests.get(segment_id) or file_digest(file_path)
+        request_digest = clip_digest if proxy is None else f"{clip_digest}:{config_fingerprint(proxy)}"
+        cache_key = make_key(request_digest, MODEL_NAME, SYSTEM_INSTRUCTION, BATCH_PROMPT, schema_fingerprint)
+        cached = default_cache.get(cache_key)
+        if cached is not None:
+            results[segment_id] = cached
+        else:
+            pending.append((segment_id, file_path, cache_key))
+            digests[segment_id] = clip_digest
+    if not pending:
+        report("Loaded cached analysis", 1.0)
+        return results
+
+    with default_recorder.track(label, match_id) as call:
+        model = default_models.model(MODEL_NAME, BATCH_CONFIG_NAME, get_batch_generation_config, SYSTEM_INSTRUCTION)
+
+        proxies = {}
+        if proxy is not None:
+            report("Building analysis proxies...", 0.0)
+            with call.phase("proxy"):
+                for segment_id, file_path, _ in pending:
+                    proxies[segment_id] = make_proxy(file_path, digest=digests[segment_id], **proxy)
+
+        report("Uploading clips to Gemini...", 0.0)
+        with call.phase("upload"):
+            files = [
+                # A proxy is not the clip digests[segment_id] was taken of; the registry hashes it instead
+                default_registry.get_or_upload(
+                    proxies[segment_id]["path"] if segment_id in proxies else file_path, mime_type="video/mp4",
+                    digest=None if segment_id in proxies else digests[segment_id],
+                )
+                for segment_id, file_path, _ in pending
+            ]
+
+        try:
+            with call.phase("processing_wait"):
+                files = wait_for_files_active(
+                    files,
+                    on_poll=lambda still_pending, elapsed: report("Processing clips... Please wait.", 0.5)
+                )
+        except FileProcessingError as e:
+            call.error = str(e)
+            return {segment_id: results.get(segment_id) for segment_id, _ in clips}
+
+        segment_ids = [segment_id for segment_id, _, _ in pending]
+        report("Waiting for a Gemini request slot...", 0.7)
+        with call.phase("queue"):
+            slot = default_scheduler.reserve(estimate_tokens(files, BATCH_PROMPT))
+        report(f"Analyzing {len(pending)} rallies...", 0.75)
+        with call.phase("generate"), slot:
+            response = model.generate_content(batch_parts(files, segment_ids, BATCH_PROMPT))
+            slot.record_usage(response)
+        call.record_usage(response)
+
+        with call.phase("parse"):
+            batch_results = split_batch_result(json.loads(response.text), segment_ids)
+            for segment_id, file_path, cache_key in pending:
+                segment_results = batch_results[segment_id]
+                if segment_results is None:
+                    continue
+                if segment_id in proxies:
+                    segment_results = remap_analysis_timestamps(segment_results, proxies[segment_id])
+                default_cache.put(cache_key, segment_results)
+                results[segment_id] = segment_results
+
+    for segment_id, file_path, _ in pending:
+        if segment_id not in results:
+            report(f"Rally {segment_id} missing from batch response, analysing it alone...", 0.9)
+            results[segment_id] = run_analysis(file_path, video_digest=digests.get(segment_id), proxy=proxy,
+                                               match_id=match_id)
+
+    report("Analysis complete!", 1.0)
+    return {segment_id: results.get(segment_id) for segment_id, _ in clips}
+
+def analyze_in_batches(video_segments, durations, max_concurrency=4, proxy=None, match_id=None, digests=None):
+    """Yield (idx, result, error) for every segment like analyze_concurrently, sending one request per batch.
+
+    digests, when given, are the segments' content hashes in the same order as video_segments.
+    """
+    batches = [[(idx + 1, video_segments[idx]) for idx in batch] for batch in plan_batches(durations)]
+    segment_digests = {idx + 1: digest for idx, digest in enumerate(digests or [])}
+    completed = analyze_concurrently(batches, partial(run_batch_analysis, proxy=proxy, match_id=match_id,
+                                                      digests=segment_digests),
+                                     max_concurrency=max_concurrency)
+    for batch_idx, batch_results, error in completed:
+        for segment_id, _ in batches[batch_idx]:
+            yield segment_id - 1, (batch_results or {}).get(segment_id), error
+
+def analyze_match_rallies(segments, video_digest, max_concurrency=4, proxy=None, batch_rallies=False):
+    """Yield (idx, result, error) for every rally of a match, resuming from the job journal.
+
+    segments is the manifest returned by segment_rallies.split_video; idx is a position in it.
+    The manifest's hashes key the result cache and upload registry, so no clip is read twice.
+    Rallies the journal already has as done are yielded straight away from their stored result;
+    the rest are analysed (one request each, or batched) and their outcome is journaled before it
+    is yielded, so an interrupted run only redoes missing or failed rallies.
+    """
+    done = default_journal.completed(video_digest)
+    for idx in sorted(done):
+        if idx < len(segments):
+            yield idx, done[idx], None
+    pending = [idx for idx in range(len(segments)) if idx not in done]
+    if not pending:
+        return
+
+    def analyze_rally(idx):
+        default_journal.mark(video_digest, idx, "running", segment_path=segments[idx]["path"])
+        return run_analysis(
+            segments[idx]["path"], video_digest=segments[idx]["sha256"], proxy=proxy, match_id=video_digest,
+            on_uploaded=lambda file: default_journal.mark(video_digest, idx, "uploaded", remote_file=file.name)
         )
-        
-        progress_bar.progress(1.0)
-        status_text.text("Analysis complete!")
-        
-        return json.loads(response.text)
+
+    if batch_rallies:
+        speed = (proxy or {}).get("speed", 1.0)
+        durations = [segments[idx]["duration"] / speed for idx in pending]
+        for idx in pending:
+            default_journal.mark(video_digest, idx, "running", segment_path=segments[idx]["path"])
+        completed = analyze_in_batches([segments[idx]["path"] for idx in pending], durations,
+                                       max_concurrency=max_concurrency, proxy=proxy, match_id=video_digest,
+                                       digests=[segments[idx]["sha256"] for idx in pending])
+    else:
+        completed = analyze_concurrently(pending, analyze_rally, max_concurrency=max_concurrency)
+
+    for position, result, error in completed:
+        idx = pending[position]
+        if error is not None:
+            default_journal.mark(video_digest, idx, "failed", error=f"{type(error).__name__}: {error}")
+        elif result is None:
+            default_journal.mark(video_digest, idx, "failed", error="Video processing failed")
+        else:
+            default_journal.mark(video_digest, idx, "done", result=result, error=None)
+        yield idx, result, error
+
+def run_windowed_analysis(file_path, on_status=None, max_concurrency=4, proxy=None, match_id=None,
+                          window=WINDOW_SECONDS, overlap=OVERLAP_SECONDS, video_digest=None):
+    """Analyse a long match as overlapping windows in parallel and stitch them into one result.
+
+    Windows with a cached analysis are not cut again; the others are cut into a private folder
+    that is removed afterwards. Windows that fail are left out of the stitched rallies and
+    flagged in its "windows" list.
+    """
+    report = on_status or (lambda message, fraction: None)
+    video_digest = video_digest or file_digest(file_path)
+    windows = plan_windows(video_duration(file_path), window, overlap)
+    prompts = [window_prompt(ANALYSIS_PROMPT, w, len(windows)) for w in windows]
+    digests = [window_digest(video_digest, w) for w in windows]
+
+    window_results = [default_cache.get(analysis_cache_key(digests[idx], proxy, prompts[idx]))
+                      for idx in range(len(windows))]
+    pending = [idx for idx, result in enumerate(window_results) if result is None]
+    if not pending:
+        report("Loaded cached analysis", 1.0)
+        return stitch_windows(window_results, windows)
+
+    report(f"Cutting {len(pending)} of {len(windows)} windows...", 0.0)
+    folder, paths = cut_windows(file_path, [windows[idx] for idx in pending], digest=video_digest)
+    window_paths = dict(zip(pending, paths))
+
+    def analyze_window(idx):
+        return run_analysis(window_paths[idx], video_digest=digests[idx], proxy=proxy, match_id=match_id,
+                            prompt=prompts[idx])
+
+    try:
+        completed = analyze_concurrently(pending, analyze_window, max_concurrency=max_concurrency)
+        for done, (idx, result, error) in enumerate(completed, 1):
+            if error is not None:
+                print(f"Window {idx + 1} failed: {error}")
+            window_results[idx] = result
+            report(f"Analysed {done} of {len(pending)} windows...", done / len(pending))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return stitch_windows(window_results, windows)
 
 def display_analysis_results(results):
     """Display the analysis results in a structured format"""
@@ -259,65 +527,119 @@ def display_analysis_results(results):
     # Display rally details
     st.header("Rally Analysis")
     for idx, rally in enumerate(match_data['Rallies'], 1):
-        with st.expander(f"Rally {idx} ({rally['from']} - {rally['to']})"):
-            st.metric("Shots in Rally", rally['rally_shots_count'])
-            
-            # Court Reach Analysis
-            st.subheader("Court Reach")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.write("Player 1")
-                for desc, time in zip(rally['Court Reach']['Player1']['Description'],
-                                    rally['Court Reach']['Player1']['Timestamp']):
-                    st.write(f"- {desc} ({time})")
-            with col2:
-                st.write("Player 2")
-                for desc, time in zip(rally['Court Reach']['Player2']['Description'],
-                                    rally['Court Reach']['Player2']['Timestamp']):
-                    st.write(f"- {desc} ({time})")
-
-            # Stamina Analysis
-            st.subheader("Stamina")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.progress(rally['Stamina']['Player1']['percentage'] / 100)
-                st.write(rally['Stamina']['Player1']['Description'])
-            with col2:
-                st.progress(rally['Stamina']['Player2']['percentage'] / 100)
-                st.write(rally['Stamina']['Player2']['Description'])
-
-            # Smashes Analysis
-            st.subheader("Smashes")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Player 1 Smashes", rally['Smashes']['Player1']['count'])
-                if rally['Smashes']['Player1']['Timestamp']:
-                    st.write("Timestamps:", ", ".join(rally['Smashes']['Player1']['Timestamp']))
-            with col2:
-                st.metric("Player 2 Smashes", rally['Smashes']['Player2']['count'])
-                if rally['Smashes']['Player2']['Timestamp']:
-                    st.write("Timestamps:", ", ".join(rally['Smashes']['Player2']['Timestamp']))
+        display_rally(idx, rally)
+
+def display_rally(idx, rally):
+    """Display one rally of the analysis as an expander"""
+    with st.expander(f"Rally {idx} ({rally['from']} - {rally['to']})"):
+        st.metric("Shots in Rally", rally['rally_shots_count'])
+        
+        # Court Reach Analysis
+        st.subheader("Court Reach")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.write("Player 1")
+            for desc, time in zip(rally['Court Reach']['Player1']['Description'],
+                                rally['Court Reach']['Player1']['Timestamp']):
+                st.write(f"- {desc} ({time})")
+        with col2:
+            st.write("Player 2")
+            for desc, time in zip(rally['Court Reach']['Player2']['Description'],
+                                rally['Court Reach']['Player2']['Timestamp']):
+                st.write(f"- {desc} ({time})")
+
+        # Stamina Analysis
+        st.subheader("Stamina")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.progress(rally['Stamina']['Player1']['percentage'] / 100)
+            st.write(rally['Stamina']['Player1']['Description'])
+        with col2:
+            st.progress(rally['Stamina']['Player2']['percentage'] / 100)
+            st.write(rally['Stamina']['Player2']['Description'])
+
+        # Smashes Analysis
+        st.subheader("Smashes")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Player 1 Smashes", rally['Smashes']['Player1']['count'])
+            if rally['Smashes']['Player1']['Timestamp']:
+                st.write("Timestamps:", ", ".join(rally['Smashes']['Player1']['Timestamp']))
+        with col2:
+            st.metric("Player 2 Smashes", rally['Smashes']['Player2']['count'])
+            if rally['Smashes']['Player2']['Timestamp']:
+                st.write("Timestamps:", ", ".join(rally['Smashes']['Player2']['Timestamp']))
+
+def display_combined_results(combined_results):
+    """Display match statistics aggregated over all analysed rallies"""
+    summary = combined_results['summary']
+    st.write(f"Total Rallies Analyzed: {combined_results['total_rallies']}")
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Average Rally (s)", f"{summary['average_rally_duration']:.1f}")
+    col2.metric("Median Rally (s)", f"{summary['rally_duration']['median']:.1f}")
+    col3.metric("Longest Rally (s)", f"{summary['longest_rally']:.1f}")
+    col4.metric("Shots per Rally", f"{summary['shots_per_rally']['mean']:.1f}")
+
+    st.subheader("Rally Duration Distribution")
+    st.bar_chart(summary['duration_histogram'])
+
+    st.subheader("Player Statistics")
+    for match in summary['matches']:
+        st.table([
+            {"Player": stats['name'], **{key.replace('_', ' '): value for key, value in stats.items() if key != 'name'}}
+            for stats in match['player_statistics'].values()
+        ])
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job(job_id):
+    """Poll a queued match analysis, showing rallies as the worker finishes them and the match once it is done"""
+    job = default_queue.get(job_id)
+    if job is None:
+        st.session_state['job_id'] = None
+        return
+    if job['status'] == "queued":
+        st.info(f"Waiting for an analysis worker ({default_queue.position(job_id)} job(s) ahead)...")
+        if not default_queue.workers():
+            st.warning("No analysis worker is running; start one with `python analysis_worker.py`.")
+    elif job['status'] == "running":
+        st.progress(job['progress'], text=job['message'] or "Analyzing video...")
+        completed = default_journal.completed(job['video_digest'])
+        for rally in default_journal.rallies(job['video_digest']):
+            idx = rally['rally_index']
+            if idx in completed:
+                with st.expander(f"Rally {idx + 1} Analysis"):
+                    display_analysis_results(completed[idx])
+            elif rally['status'] == "failed":
+                st.error(f"Error analyzing rally {idx + 1}: {rally['error']}")
+    elif job['status'] == "failed":
+        st.error(f"An error occurred during analysis: {job['error']}")
+        st.session_state['job_id'] = None
+    else:
+        st.session_state['job_id'] = None
+        st.session_state['analysis_results'] = job['result']
+        st.rerun()
+
+def render_worker_stats(totals):
+    """Sidebar captions for AnalysisQueue.worker_totals: result cache, connection reuse and Gemini queue"""
+    if not totals["processes"]:
+        return
+    cache, connections, queue = totals["cache"], totals["connections"], totals["scheduler"]
+    st.sidebar.caption(f"Result cache: {cache['hits']} hits / {cache['misses']} misses "
+                       f"({totals['processes']} worker process(es))")
+    if connections["requests"]:
+        reused = 1 - connections["connections_opened"] / connections["requests"]
+        st.sidebar.caption(f"Gemini connections: {connections['connections_opened']} opened for "
+                           f"{connections['requests']} requests ({reused:.0%} reused)")
+    if queue["waiting"] or queue["throttled"]:
+        st.sidebar.caption(f"Gemini queue: {queue['waiting']} waiting · {queue['throttled']} rate-limit hits")
+
+def follow_job():
+    """Show the job just picked in the sidebar's "Follow a running analysis" box"""
+    if st.session_state['followed_job'] is not None:
+        st.session_state['job_id'] = st.session_state['followed_job']
 
 def main():
-    
-    timestamps = {
-        "rallies": [
-            { "start": 0.05, "end": 0.2 },
-            { "start": 0.24, "end": 0.39 },
-            { "start": 0.41, "end": 0.47 },
-            { "start": 0.49, "end": 0.77 },
-            { "start": 0.79, "end": 1.13 },
-            { "start": 1.17, "end": 1.21 },
-            { "start": 1.24, "end": 1.3 },
-            { "start": 1.32, "end": 1.43 },
-            { "start": 1.45, "end": 2.01 },
-            { "start": 2.03, "end": 2.18 },
-            { "start": 2.19, "end": 2.23 },
-            { "start": 2.26, "end": 2.31 },
-            { "start": 2.33, "end": 2.37 },
-            { "start": 2.38, "end": 2.51 }
-        ]
-    }
     st.set_page_config(page_title="Badminton Match Analyzer", layout="wide")
     init_app()
     
@@ -325,116 +647,60 @@ def main():
     st.write("Upload a badminton match video for detailed analysis of player performance, rallies, and statistics.")
     
     uploaded_file = st.file_uploader("Upload a video file", type=["mp4", "mov", "avi", "mkv"])
+    max_concurrency = st.sidebar.slider("Rallies analysed in parallel", min_value=1, max_value=16, value=4)
+    proxy_name = st.sidebar.selectbox("Upload proxy", ["Original"] + list(PROXY_PRESETS))
+    proxy = PROXY_PRESETS.get(proxy_name)
+    batch_rallies = st.sidebar.checkbox("Send several rallies per request", value=False,
+                                        help="Fewer, larger Gemini requests; batch size follows rally durations")
+    # The analysis workers make the Gemini calls, so these come from what they report and log
+    render_worker_stats(default_queue.worker_totals())
+    render_summary(st.sidebar.expander("Gemini usage (all matches)"), default_recorder.logged_summary())
+    past_matches = {
+        f"{m['video_name']} ({m['player1']} vs {m['player2']}, {m['rally_count']} rallies)": m['match_id']
+        for m in default_store.list_matches()
+    }
+    past_match = st.sidebar.selectbox("Previously analysed matches", ["None"] + list(past_matches))
+    active_jobs = {
+        job['id']: f"#{job['id']} {job['video_name']} ({job['status']}, {job['progress']:.0%})"
+        for status in ("running", "queued") for job in default_queue.jobs(status=status)
+        if job['kind'] == "match"
+    }
+    if active_jobs:
+        # Options are job ids, so progress updates do not reset the widget; the job is only
+        # followed when the user picks it, not on every rerun after "Analyze Video"
+        st.sidebar.selectbox("Follow a running analysis", [None] + list(active_jobs), key='followed_job',
+                             format_func=lambda job_id: "None" if job_id is None else active_jobs[job_id],
+                             on_change=follow_job)
     
     if uploaded_file:
         st.video(uploaded_file)
         
         if st.button("Analyze Video"):
-            file_path = save_uploaded_file(uploaded_file)
-            split_video(file_path, timestamps)         
-
-            segments_dir = "/home/auriga/Documents/Badmition_Video_Analytics/video_segments"
-            
-            try:
-                # Get all video segments
-                video_segments = glob(os.path.join(segments_dir, "*.[mM][pP]4"))
-                
-                if not video_segments:
-                    st.error("No video segments found after splitting.")
-                    return
-                
-                # Create progress bar
-                progress_bar = st.progress(0)
-                all_results = []
-                
-                # Process each segment
-                for idx, segment_path in enumerate(video_segments):
-                    st.write(f"Analyzing rally {idx + 1}/{len(video_segments)}")
-                    print("==========================================",segment_path)
-                    
-                    try:
-                        # Analyze current segment
-                        segment_results = analyze_video(segment_path)
-                        
-                        if segment_results:
-                            # Add segment identifier
-                            segment_results['segment_id'] = idx + 1
-                            segment_results['timestamp'] = timestamps['rallies'][idx]
-                            all_results.append(segment_results)
-                            
-                            # Show individual segment results
-                            with st.expander(f"Rally {idx + 1} Analysis"):
-                                display_analysis_results(segment_results)
-                    
-                    except Exception as e:
-                        st.error(f"Error analyzing rally {idx + 1}: {str(e)}")
-                    
-                    # Update progress
-                    progress_bar.progress((idx + 1) / len(video_segments))
-                
-                # Store and display combined results
-                if all_results:
-                    combined_results = {
-                        'individual_rallies': all_results,
-                        'total_rallies': len(all_results),
-                        'timestamps': timestamps,
-                        'summary': calculate_summary(all_results)  # You'll need to implement this
-                    }
-                    
-                    st.session_state['analysis_results'] = combined_results
-                    
-                    st.write("### Overall Match Analysis")
-                    display_combined_results(combined_results)  # You'll need to implement this
-                    
-            except Exception as e:
-                st.error(f"An error occurred during analysis: {str(e)}")
-            finally:
-                # Cleanup
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                # Optionally, clean up segments:
-                # for segment in video_segments:
-                #     if os.path.exists(segment):
-                #         os.remove(segment)
-    
+            file_path, video_digest = save_uploaded_file(uploaded_file)
+            # An analysis_worker process runs the job, so it survives reruns and refreshes of this page;
+            # a video seen before resumes from its journaled rallies there
+            st.session_state['job_id'] = default_queue.enqueue(
+                "match", video_digest, file_path, uploaded_file.name,
+                options={"max_concurrency": max_concurrency, "proxy": proxy_name if proxy is not None else None,
+                         "batch_rallies": batch_rallies, "delete_source": True},
+            )
+            st.session_state['analysis_results'] = None
+
+    if st.session_state.get('job_id') is not None:
+        show_job(st.session_state['job_id'])
+
+    # Stored matches are shown without calling Gemini again
+    elif past_match != "None":
+        st.write("### Overall Match Analysis")
+        display_combined_results(default_store.load_match(past_matches[past_match]))
+
     # Display previous results if they exist
     elif st.session_state.get('analysis_results'):
-        display_analysis_results(st.session_state['analysis_results'])
-        
-    def calculate_summary(all_results):
-        """
-        Calculate summary statistics from all rally results
-        Implement based on your specific metrics
-        """
-        summary = {
-            'total_points': len(all_results),
-            'average_rally_duration': 0,
-            'longest_rally': 0,
-            'shortest_rally': float('inf'),
-            'player_statistics': {}
-        }
-        
-        for rally in all_results:
-            # Add your specific summary calculations here
-            # This is just an example structure
-            pass
-        
-        return summary
-
-    def display_combined_results(combined_results):
-        """
-        Display the combined analysis results
-        Implement based on your specific visualization needs
-        """
-        st.write(f"Total Rallies Analyzed: {combined_results['total_rallies']}")
-        
-        # Add your specific visualization code here
-        # For example:
-        # - Overall match statistics
-        # - Rally distribution charts
-        # - Player performance summaries
-        # - Timeline visualization
-        pass
+        combined_results = st.session_state['analysis_results']
+        st.write("### Overall Match Analysis")
+        display_combined_results(combined_results)
+        if combined_results.get('usage'):
+            render_summary(st, combined_results['usage'], title="Gemini usage for this match")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,31 @@
+"""
+Connection handling shared by the SQLite-backed stores: results_store, job_journal,
+analysis_queue and request_scheduler's shared quota.
+"""
+
+import sqlite3
+
+class SQLiteStore:
+    """Base of a store kept in the SQLite file at path, with the tables of the subclass's schema.
+
+    Each call opens its own connection, so a store is safe across threads and processes. The
+    database file and tables are created on first use rather than at import.
+    """
+
+    schema = ""
+    foreign_keys = False
+
+    def __init__(self, path):
+        self.path = path
+        self._ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if self.foreign_keys:
+            conn.execute("PRAGMA foreign_keys=ON")
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.schema)
+            self._ready = True
+        return conn
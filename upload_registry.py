@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from result_cache import file_digest
+from atomic_file import atomic_write_json
+
+REGISTRY_PATH = os.getenv("UPLOAD_REGISTRY_PATH", ".gemini_uploads.json")
+# Don't hand out files that expire before an analysis could finish with them
+EXPIRY_MARGIN_SECONDS = 15 * 60
+USABLE_STATES = ("ACTIVE", "PROCESSING")
+
+class UploadRegistry:
+    """Local map of file content hash -> uploaded Gemini file name and expiry time.
+
+    Lets callers reuse a file that is still live on the server instead of uploading
+    the same bytes again. The file is shared by every process (the analysis workers, the
+    apps): each change re-reads it and writes it back under an exclusive lock on
+    <path>.lock, so no process drops the entries another one recorded meanwhile.
+    """
+
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @contextmanager
+    def _update(self):
+        """Yield the entries as currently on disk and save them back, locked against other
+        threads and processes for the whole read-modify-write"""
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = self._read()
+                before = dict(entries)
+                yield entries
+                if entries != before:
+                    self._save(entries)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self, entries):
+        atomic_write_json(self.path, entries, indent=2)
+
+    def _forget(self, digest):
+        with self._update() as entries:
+            entries.pop(digest, None)
+
+    def evict_expired(self):
+        """Drop every entry whose remote file has expired (or is about to)"""
+        now = time.time()
+        with self._update() as entries:
+            for digest in [d for d, e in entries.items() if e['expires_at'] - EXPIRY_MARGIN_SECONDS <= now]:
+                del entries[digest]
+
+    def lookup(self, digest):
+        """Return the live remote file for a content hash, or None if it must be uploaded again"""
+        self.evict_expired()
+        # Saves replace the file atomically, so a plain read never sees half of one
+        entry = self._read().get(digest)
+        if entry is None:
+            return None
+
+        try:
+            remote = genai.get_file(entry['name'])
+        except (api_exceptions.NotFound, api_exceptions.PermissionDenied):
+            self._forget(digest)
+            return None
+
+        if remote.state.name not in USABLE_STATES:
+            self._forget(digest)
+            return None
+        return remote
+
+    def record(self, digest, remote):
+        """Remember an uploaded file under its content hash"""
+        with self._update() as entries:
+            entries[digest] = {
+                'name': remote.name,
+                'uri': remote.uri,
+                'expires_at': remote.expiration_time.timestamp(),
+            }
+
+    def get_or_upload(self, path, mime_type=None, digest=None):
+        """Return a usable remote file for path, uploading only when no live copy is registered"""
+        digest = digest or file_digest(path)
+        remote = self.lookup(digest)
+        if remote is not None:
+            print(f"Reusing uploaded file {remote.name} for {path}")
+            return remote
+
+        remote = genai.upload_file(path, mime_type=mime_type)
+        self.record(digest, remote)
+        return remote
+
+default_registry = UploadRegistry()